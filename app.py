@@ -1,452 +1,924 @@
-from fastapi import FastAPI, Form, Request
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
+from starlette.requests import ClientDisconnect
 from fastapi.staticfiles import StaticFiles
 import uvicorn
-import pickle
-import pandas as pd
+import asyncio
+import json
+import hmac
 import os
+import tempfile
+import threading
+import time
+from contextlib import asynccontextmanager
+from functools import partial
 from pathlib import Path
 from typing import Optional
 
-app = FastAPI(title="AyurSutra Feedback Model", description="AI-powered Panchakarma therapy feedback system")
+from native_threads import limit_native_threads
+
+# Inference parallelism comes from the inference pool below, so keep NumPy's native
+# BLAS/OpenMP pools from spawning extra threads per call (must precede the NumPy import)
+limit_native_threads(os.environ.get("INFERENCE_NATIVE_THREADS", "1"), override=False)
+
+import numpy as np
+
+from batcher import MicroBatcher
+from compiled_model import CompiledPipeline, fuse_compiled
+from explain import Explainer, load_explainer, summarize
+from general_table import GeneralTable
+from inference_pool import InferencePool, Overloaded
+from metrics import CONTENT_TYPE, Registry
+from model_manager import ModelManager
+from result_store import open_result_store, result_id
+from session_history import open_session_history
+from progress import BETTER
+from whatif import sweep
+from prediction_cache import PredictionCache, cache_key
+from profiling import ProfileStore, ProfilingMiddleware
+from static_pages import render_pages
+from therapies import feature_defaults, model_files, therapy_dosha, therapy_features
+from therapy_schema import SchemaValidationError, TherapySchema
 
-# Load all models
 base_dir = Path(__file__).resolve().parent
-models = {}
-try:
-    with open(base_dir / "Basti_model.pkl", "rb") as f:
-        models["basti"] = pickle.load(f)
-    with open(base_dir / "Nasya_model.pkl", "rb") as f:
-        models["nasya"] = pickle.load(f)
-    with open(base_dir / "Vamana_model.pkl", "rb") as f:
-        models["vamana"] = pickle.load(f)
-    with open(base_dir / "Virechana_model.pkl", "rb") as f:
-        models["virechana"] = pickle.load(f)
-    with open(base_dir / "Raktamokshana_model.pkl", "rb") as f:
-        models["raktamokshana"] = pickle.load(f)
-    with open(base_dir / "General_model.pkl", "rb") as f:
-        models["general"] = pickle.load(f)
-except Exception as e:
-    print(f"Error loading models: {e}")
+
+# Models load concurrently in the background at startup and are warmed before
+# /readyz reports ready; MODEL_LOADING=lazy loads each one on first use instead
+model_manager = ModelManager(base_dir, model_files)
+models = model_manager.models
+lazy_loading = os.environ.get("MODEL_LOADING", "eager") == "lazy"
+
+@asynccontextmanager
+async def lifespan(app):
+    if not lazy_loading:
+        model_manager.start_background()
+    # Each worker process polls the artifacts itself (threads do not survive the fork)
+    model_manager.start_watching(float(os.environ.get("MODEL_WATCH_INTERVAL", 5)))
+    # Likewise the session writer: created at import, it is started in each worker
+    if session_history is not None:
+        session_history.start()
+    yield
+    if session_history is not None:
+        session_history.close()
+
+app = FastAPI(title="AyurSutra Feedback Model", description="AI-powered Panchakarma therapy feedback system", lifespan=lifespan)
+
+class FirstRequestTimer:
+    """Records how long the first request served by this process took"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or model_manager.first_request_seconds is not None:
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            model_manager.record_first_request(time.perf_counter() - start)
+
+app.add_middleware(FirstRequestTimer)
+
+# Prometheus metrics served at /metrics; cheap enough to stay on in production
+metrics = Registry()
+http_requests = metrics.counter("ayursutra_http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+http_latency = metrics.histogram("ayursutra_http_request_seconds", "HTTP request latency", ("method", "route"))
+http_in_flight = metrics.gauge("ayursutra_http_requests_in_flight", "HTTP requests currently being served")
+stage_latency = metrics.histogram("ayursutra_stage_seconds", "Latency of each prediction stage", ("therapy", "stage"))
+prediction_errors = metrics.counter("ayursutra_prediction_errors_total", "Predictions that failed with an error page", ("therapy", "error"))
+
+class RequestMetrics:
+    """Counts requests, in-flight requests and latency per matched route"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = 500
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+        # Handlers read this to time the parsing done before they are called
+        start = scope["metrics_start"] = time.perf_counter()
+        http_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_in_flight.dec()
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            http_requests.inc(scope["method"], path, str(status))
+            http_latency.observe(time.perf_counter() - start, scope["method"], path)
+
+app.add_middleware(RequestMetrics)
+
+def request_therapy(scope):
+    """Therapy a request is about, from its path parameters or its first path segment"""
+    therapy = scope.get("path_params", {}).get("therapy") or scope["path"].strip("/").split("/")[0]
+    return therapy.lower() if therapy.lower() in model_files else None
+
+class ModelVersionHeader:
+    """Adds X-Model-Version (e.g. basti=1a2b3c4d5e6f,general=...) to every therapy response"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        # Stored result pages carry the versions that scored them (see show_results), not the live ones
+        if scope["type"] != "http" or scope["path"].startswith("/results/"):
+            return await self.app(scope, receive, send)
+
+        async def send_with_version(message):
+            if message["type"] == "http.response.start":
+                # Routing has filled in path_params by the time the response starts
+                therapy = request_therapy(scope)
+                names = list(model_manager.versions) if scope["path"] == "/predict_all" else [therapy, "general"] if therapy else []
+                versions = model_manager.versions
+                value = ",".join(f"{name}={versions[name].version}" for name in names if name in versions)
+                if value:
+                    message = {**message, "headers": [*message.get("headers", []), (b"x-model-version", value.encode("latin-1"))]}
+            await send(message)
+
+        await self.app(scope, receive, send_with_version)
+
+app.add_middleware(ModelVersionHeader)
+
+# Requests carrying X-Profile: $PROFILE_TOKEN, plus a PROFILE_SAMPLE_RATE fraction of all
+# requests, are profiled into PROFILE_DIR (newest PROFILE_KEEP kept)
+profile_token = os.environ.get("PROFILE_TOKEN")
+profile_store = ProfileStore(
+    os.environ.get("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "ayursutra-profiles")),
+    keep=int(os.environ.get("PROFILE_KEEP", 50))
+)
+app.add_middleware(
+    ProfilingMiddleware,
+    store=profile_store,
+    token=profile_token,
+    sample_rate=float(os.environ.get("PROFILE_SAMPLE_RATE", 0)),
+    tag=request_therapy
+)
+
+def require_token(request, token, header, env_var):
+    """403 unless ``env_var`` is configured and the request's ``header`` matches it"""
+    if not token or not hmac.compare_digest(request.headers.get(header, ""), token):
+        raise HTTPException(status_code=403, detail=f"Needs {env_var} and a matching {header} header")
+
+def require_profile_token(request):
+    # Profiles expose stacks and file paths: without a configured token nobody may read them
+    require_token(request, profile_token, "X-Profile", "PROFILE_TOKEN")
+
+def observe_parse(request, therapy):
+    """Record the time from request arrival to the handler (routing and middleware)"""
+    start = request.scope.get("metrics_start")
+    if start is not None:
+        stage_latency.observe(time.perf_counter() - start, therapy, "parse")
+
+# CPU-bound inference runs on its own bounded pool; when INFERENCE_MAX_PENDING calls are
+# already running or queued, requests fail fast with 503 + Retry-After
+inference_pool = InferencePool(
+    max_workers=int(os.environ.get("INFERENCE_WORKERS", min(4, os.cpu_count() or 1))),
+    max_pending=int(os.environ.get("INFERENCE_MAX_PENDING", 256)),
+    retry_after=int(os.environ.get("RETRY_AFTER_SECONDS", 1))
+)
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
 
 templates = Jinja2Templates(directory="templates")
 
-# Feature lists for each therapy
-therapy_features = {
-    "basti": [
-        "Concentration", "Sleep_Quality", "Digestion", "Flexibility",
-        "Energy_Level", "Appetite", "Stress_Level", "Physical_Activity",
-        "Hydration", "Mood_Swings", "Mood",
-        "Bowel_Dryness", "Gas_Formation", "Lower_Back_Pain",
-        "Urinary_Frequency", "Constipation_Level"
-    ],
-    "nasya": [
-        "Concentration", "Sleep_Quality", "Digestion", "Flexibility",
-        "Energy_Level", "Appetite", "Stress_Level", "Physical_Activity",
-        "Hydration", "Mood_Swings", "Mood",
-        "Nasal_Dryness", "Headache", "Dizziness", "Sinus_Congestion", "Throat_Dryness"
-    ],
-    "vamana": [
-        "Concentration", "Sleep_Quality", "Digestion", "Flexibility",
-        "Energy_Level", "Appetite", "Stress_Level", "Physical_Activity",
-        "Hydration", "Mood_Swings", "Mood",
-        "Nausea", "Acidity", "Weight_Gain", "Food_Intolerance", "Bloating"
-    ],
-    "virechana": [
-        "Concentration", "Sleep_Quality", "Digestion", "Flexibility",
-        "Energy_Level", "Appetite", "Stress_Level", "Physical_Activity",
-        "Hydration", "Mood_Swings", "Mood",
-        "Acidity", "Heartburn", "Skin_Issues", "Body_Heat", "Irritability"
-    ],
-    "raktamokshana": [
-        "Concentration", "Sleep_Quality", "Digestion", "Flexibility",
-        "Energy_Level", "Appetite", "Stress_Level", "Physical_Activity",
-        "Hydration", "Mood_Swings", "Mood",
-        "Skin_Redness", "Joint_Pain", "Inflammation", "Blood_Pressure", "Circulation"
-    ]
+# The home page and therapy forms are static: render them once, serve bytes with ETags
+form_templates = {
+    "home": "index.html",
+    "basti": "Basti_form.html",
+    "nasya": "Nasya_form.html",
+    "vamana": "Vamana_form.html",
+    "virechana": "Virechana_form.html",
+    "raktamokshana": "Raktamokshana.html"
+}
+static_pages = render_pages(
+    templates.env, form_templates.values(), max_age=int(os.environ.get("STATIC_PAGE_MAX_AGE", 3600))
+)
+
+def form_page(request, name):
+    return static_pages[form_templates[name]].respond(request)
+
+# Predictions keyed by model name + encoded answers; PREDICTION_CACHE_SIZE=0 disables it
+prediction_cache = PredictionCache(max_entries=int(os.environ.get("PREDICTION_CACHE_SIZE", 4096)))
+
+# Concurrent single-row predictions per model are coalesced into one batched predict
+def predict_codes(name, X):
+    with model_manager.use(name) as model:
+        return model.predict_codes(X)
+
+batchers = {
+    name: MicroBatcher(
+        partial(predict_codes, name),
+        max_batch_size=int(os.environ.get("MICROBATCH_MAX_SIZE", 64)),
+        max_wait=float(os.environ.get("MICROBATCH_MAX_WAIT_MS", 2)) / 1000,
+        max_queue=int(os.environ.get("MICROBATCH_MAX_QUEUE", 1024)),
+        runner=inference_pool.run
+    )
+    for name in model_files
 }
 
-general_features = [
-    "Concentration", "Sleep_Quality", "Digestion", "Flexibility",
-    "Energy_Level", "Appetite", "Stress_Level", "Physical_Activity",
-    "Hydration", "Mood_Swings", "Mood"
-]
+async def cached_predict(name, codes, therapy=None):
+    """Predict one row of ordinal codes with the named model, reusing the result for repeated answers.
+
+    Stage timings are labelled with ``therapy``; a model other than the therapy's
+    own (the General model) gets its name as a stage prefix.
+    """
+    therapy = therapy or name
+    prefix = "" if name == therapy else f"{name}_"
+    model = model_manager.get(name)
+    # Keyed by version, so a reloaded model never serves its predecessor's results
+    version = model_manager.version(name)
+    key = cache_key(f"{name}@{version}", codes)
+    pred = prediction_cache.get(key)
+    if pred is None:
+        start = time.perf_counter()
+        # A table lookup is cheaper than the queue round trip
+        if isinstance(model, GeneralTable):
+            pred = model.predict_codes(codes)
+        else:
+            try:
+                pred = (await batchers[name].submit(codes))[None, :]
+            except asyncio.QueueFull:
+                raise Overloaded(f"Prediction queue for {name} is full", inference_pool.retry_after)
+        stage_latency.observe(time.perf_counter() - start, therapy, f"{prefix}predict")
+        pred.setflags(write=False)
+        if model_manager.version(name) == version:
+            prediction_cache.put(key, pred)
+    return pred
+
+# Per-feature explanations shown on every result page; EXPLANATIONS=off skips them
+explanations_enabled = os.environ.get("EXPLANATIONS", "on") != "off"
+explainers = {}
+explainer_lock = threading.Lock()
+
+def get_explainer(name):
+    """Build (once per model version) the contribution tables; the General table needs its trees too"""
+    version = model_manager.version(name)
+    cached = explainers.get(name)
+    if cached is None or cached[0] != version:
+        with explainer_lock:
+            cached = explainers.get(name)
+            if cached is None or cached[0] != version:
+                model = model_manager.get(name)
+                explainer = Explainer(model) if isinstance(model, CompiledPipeline) else load_explainer(model_files[name], base_dir)
+                cached = explainers[name] = version, explainer
+    return cached[1]
+
+async def explainer_for(name):
+    """The current version's explainer; a miss builds its tables on the inference pool, not the event loop"""
+    cached = explainers.get(name)
+    if cached is not None and cached[0] == model_manager.version(name):
+        return cached[1]
+    return await inference_pool.run(get_explainer, name)
+
+def warm_explainers():
+    for name in model_files:
+        try:
+            get_explainer(name)
+        except Exception as e:
+            print(f"Explanations unavailable for {name}: {e}")
+
+if explanations_enabled:
+    model_manager.on_ready(warm_explainers)
+
+def output_names(therapy):
+    return [f"{therapy_dosha[therapy]}_level", "overall_improvement"]
 
-# Global variable to store last results (in production, use sessions or database)
-last_results = {}
+async def cached_explain(name, codes, therapy=None):
+    """Contributions ``(n_features, n_outputs)`` of one row of codes, reused for repeated answers"""
+    therapy = therapy or name
+    prefix = "" if name == therapy else f"{name}_"
+    key = cache_key(f"{name}@{model_manager.version(name)}:explain", codes)
+    contributions = prediction_cache.get(key)
+    if contributions is None:
+        start = time.perf_counter()
+        contributions = (await inference_pool.run(lambda: get_explainer(name).contributions(codes)))[0]
+        stage_latency.observe(time.perf_counter() - start, therapy, f"{prefix}explain")
+        contributions.setflags(write=False)
+        prediction_cache.put(key, contributions)
+    return contributions
+
+async def explain_therapy(therapy, codes, general_columns, values):
+    """Readable contributions for the therapy model's outputs and the General model's"""
+    therapy_explainer, general_explainer = await explainer_for(therapy), await explainer_for("general")
+    therapy_contribs = await cached_explain(therapy, codes, therapy)
+    general_contribs = await cached_explain("general", codes[general_columns], therapy)
+    general_values = [values[j] for j in general_columns]
+    return (
+        summarize(therapy_contribs, therapy_explainer.expected_value, therapy_explainer.feature_names, values,
+                  output_names(therapy)[:therapy_explainer.n_outputs])
+        + summarize(general_contribs, general_explainer.expected_value, general_explainer.feature_names,
+                    general_values, ["general_improvement"])
+    )
+
+# Each therapy's accepted fields with the notebooks' category orders; bound to the
+# loaded model's feature order on first use
+therapy_schemas = {
+    therapy: TherapySchema(therapy, features, defaults=feature_defaults)
+    for therapy, features in therapy_features.items()
+}
+therapy_codecs = {}
+
+def check_schema(name, model):
+    """Reject a reloaded therapy model whose features no longer match its form schema"""
+    schema = therapy_schemas.get(name)
+    if schema is None:
+        return
+    for feature in model.feature_names:
+        if list(model.categories[feature]) != schema.categories.get(feature):
+            raise ValueError(f"feature {feature!r} does not match the {name} form schema")
+
+model_manager.add_validator(check_schema)
+
+# Results live under a hash of the therapy + answers, so each submission gets its own
+# immutable URL; RESULT_STORE=sqlite:///path/results.db shares them across worker processes
+result_ttl = int(os.environ.get("RESULT_TTL_SECONDS", 86400))
+result_store = open_result_store(
+    os.environ.get("RESULT_STORE", "memory"),
+    max_entries=int(os.environ.get("RESULT_STORE_SIZE", 10000)),
+    ttl=result_ttl
+)
+
+# Every form prediction made for a patient is appended to their history by a background
+# writer; SESSION_HISTORY=off disables it. Reading it back needs X-History-Token: $HISTORY_TOKEN
+session_history = open_session_history(os.environ.get("SESSION_HISTORY", f"sqlite:///{base_dir / 'sessions.db'}"))
+history_token = os.environ.get("HISTORY_TOKEN")
+
+def require_history_token(request):
+    # Patients' answers and scores: nobody reads them without a configured token
+    require_token(request, history_token, "X-History-Token", "HISTORY_TOKEN")
+PATIENT_ID_MAX_LENGTH = 128
+
+def patient_id(request, fields):
+    """The submission's patient_id field or X-Patient-ID header, if any"""
+    patient = fields.get("patient_id") or request.headers.get("x-patient-id")
+    if patient is not None and (not isinstance(patient, str) or len(patient) > PATIENT_ID_MAX_LENGTH):
+        raise SchemaValidationError([{
+            "type": "string_type", "loc": ["body", "patient_id"],
+            "msg": f"Expected a string of at most {PATIENT_ID_MAX_LENGTH} characters", "input": patient,
+        }])
+    return patient
+
+result_templates = {
+    "basti": "result_basti.html",
+    "nasya": "result_nasya.html",
+    "vamana": "result_vamana.html",
+    "virechana": "result_virechana.html",
+    "raktamokshana": "result_raktamokshana.html"
+}
+# Compiled once up front; rendering skips TemplateResponse's per-request context setup
+compiled_results = {therapy: templates.env.get_template(name) for therapy, name in result_templates.items()}
+
+def render_result(therapy, results, headers=None):
+    with stage_latency.time(therapy, "render"):
+        body = compiled_results[therapy].render(**results)
+    return HTMLResponse(body, headers=headers)
+
+def json_value(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def versioned_result_id(therapy, values, results):
+    """Result ID of the answers and the model versions that scored them, so reloads never rewrite a result"""
+    versions = [f"{name}={version}" for name, version in sorted(results.get("model_version", {}).items())]
+    return result_id(therapy, [*values, *versions])
+
+async def store_result(rid, results):
+    # Stored as plain JSON values; the SQLite store does disk I/O, which must not run on the event loop
+    stored = {k: json_value(v) for k, v in results.items()}
+    if result_store.blocking:
+        await asyncio.to_thread(result_store.put, rid, stored)
+    else:
+        result_store.put(rid, stored)
+
+async def respond_with_result(request, therapy, values, results):
+    """Store a prediction and redirect to its result page, or return it inline when asked.
+
+    Accept: application/json gets the result as JSON; Prefer: return=representation
+    gets the rendered result page directly instead of a 303.
+    """
+    with stage_latency.time(therapy, "store"):
+        rid = versioned_result_id(therapy, values, results)
+        await store_result(rid, results)
+    url = f"/results/{therapy}/{rid}"
+    if "application/json" in request.headers.get("accept", ""):
+        return JSONResponse({"id": rid, "url": url, **{k: json_value(v) for k, v in results.items()}})
+    if "return=representation" in request.headers.get("prefer", ""):
+        return render_result(therapy, results)
+    return RedirectResponse(url=url, status_code=303)
 
 @app.get("/", response_class=HTMLResponse)
 def home(request: Request):
     """Home page with therapy selection"""
-    return templates.TemplateResponse("index.html", {"request": request})
-
-# Basti therapy routes
-@app.get("/basti", response_class=HTMLResponse)
-def basti_form(request: Request):
-    return templates.TemplateResponse("Basti_form.html", {"request": request})
-
-@app.post("/basti/predict", response_class=HTMLResponse)
-def predict_basti(
-    request: Request,
-    Concentration: str = Form(...),
-    Sleep_Quality: str = Form(...),
-    Digestion: str = Form(...),
-    Flexibility: str = Form("Average"),
-    Energy_Level: str = Form(...),
-    Appetite: str = Form(...),
-    Stress_Level: str = Form(...),
-    Physical_Activity: str = Form(...),
-    Hydration: str = Form(...),
-    Mood_Swings: str = Form(...),
-    Mood: str = Form(...),
-    Bowel_Dryness: str = Form(...),
-    Gas_Formation: str = Form(...),
-    Lower_Back_Pain: str = Form(...),
-    Urinary_Frequency: str = Form(...),
-    Constipation_Level: str = Form(...)
-):
-    try:
-        form_data = {
-            "Concentration": [Concentration],
-            "Sleep_Quality": [Sleep_Quality],
-            "Digestion": [Digestion],
-            "Flexibility": [Flexibility],
-            "Energy_Level": [Energy_Level],
-            "Appetite": [Appetite],
-            "Stress_Level": [Stress_Level],
-            "Physical_Activity": [Physical_Activity],
-            "Hydration": [Hydration],
-            "Mood_Swings": [Mood_Swings],
-            "Mood": [Mood],
-            "Bowel_Dryness": [Bowel_Dryness],
-            "Gas_Formation": [Gas_Formation],
-            "Lower_Back_Pain": [Lower_Back_Pain],
-            "Urinary_Frequency": [Urinary_Frequency],
-            "Constipation_Level": [Constipation_Level]
-        }
-        
-        df_basti = pd.DataFrame(form_data)
-        df_general = pd.DataFrame({f: form_data[f] for f in general_features})
-        
-        basti_pred = models["basti"].predict(df_basti)
-        general_pred = models["general"].predict(df_general)
-        
-        vata_level = basti_pred[0] if basti_pred.ndim == 1 else basti_pred[0][0]
-        overall_improvement = basti_pred[0][1] if (basti_pred.ndim == 2 and basti_pred.shape[1] > 1) else None
-        general_improvement = general_pred[0]
-        
-        global last_results
-        last_results = {
-            "therapy": "Basti",
-            "vata_level": vata_level,
-            "overall_improvement": overall_improvement,
-            "general_improvement": general_improvement
-        }
-        
-        return RedirectResponse(url="/results/basti", status_code=303)
-        
-    except Exception as e:
-        return HTMLResponse(f"<h3 style='color:red;'>❌ Error: {e}</h3>")
+    return form_page(request, "home")
 
-# Nasya therapy routes
-@app.get("/nasya", response_class=HTMLResponse)
-def nasya_form(request: Request):
-    return templates.TemplateResponse("Nasya_form.html", {"request": request})
-
-@app.post("/nasya/predict", response_class=HTMLResponse)
-def predict_nasya(
-    request: Request,
-    Concentration: str = Form(...),
-    Sleep_Quality: str = Form(...),
-    Digestion: str = Form(...),
-    Flexibility: str = Form("Average"),
-    Energy_Level: str = Form(...),
-    Appetite: str = Form(...),
-    Stress_Level: str = Form(...),
-    Physical_Activity: str = Form(...),
-    Hydration: str = Form(...),
-    Mood_Swings: str = Form(...),
-    Mood: str = Form(...),
-    Nasal_Dryness: str = Form(...),
-    Headache: str = Form(...),
-    Dizziness: str = Form(...),
-    Sinus_Congestion: str = Form(...),
-    Throat_Dryness: str = Form(...)
-):
-    try:
-        form_data = {
-            "Concentration": [Concentration],
-            "Sleep_Quality": [Sleep_Quality],
-            "Digestion": [Digestion],
-            "Flexibility": [Flexibility],
-            "Energy_Level": [Energy_Level],
-            "Appetite": [Appetite],
-            "Stress_Level": [Stress_Level],
-            "Physical_Activity": [Physical_Activity],
-            "Hydration": [Hydration],
-            "Mood_Swings": [Mood_Swings],
-            "Mood": [Mood],
-            "Nasal_Dryness": [Nasal_Dryness],
-            "Headache": [Headache],
-            "Dizziness": [Dizziness],
-            "Sinus_Congestion": [Sinus_Congestion],
-            "Throat_Dryness": [Throat_Dryness]
-        }
-        
-        df_nasya = pd.DataFrame(form_data)
-        df_general = pd.DataFrame({f: form_data[f] for f in general_features})
-        
-        nasya_pred = models["nasya"].predict(df_nasya)
-        general_pred = models["general"].predict(df_general)
-        
-        vata_level = nasya_pred[0] if nasya_pred.ndim == 1 else nasya_pred[0][0]
-        overall_improvement = nasya_pred[0][1] if (nasya_pred.ndim == 2 and nasya_pred.shape[1] > 1) else None
-        general_improvement = general_pred[0]
-        
-        global last_results
-        last_results = {
-            "therapy": "Nasya",
-            "vata_level": vata_level,
-            "overall_improvement": overall_improvement,
-            "general_improvement": general_improvement
-        }
-        
-        return RedirectResponse(url="/results/nasya", status_code=303)
-        
-    except Exception as e:
-        return HTMLResponse(f"<h3 style='color:red;'>❌ Error: {e}</h3>")
+def therapy_codec(therapy):
+    """Decoder into the therapy model's feature order, and where the General model's columns sit in it"""
+    codec = therapy_codecs.get(therapy)
+    if codec is None:
+        model = model_manager.get(therapy)
+        decoder = therapy_schemas[therapy].bind(model.feature_names, model.categories)
+        general = model_manager.get("general")
+        general_columns = np.array([decoder.feature_names.index(f) for f in general.feature_names], dtype=np.intp)
+        codec = therapy_codecs[therapy] = decoder, general_columns
+    return codec
 
-# Vamana therapy routes
-@app.get("/vamana", response_class=HTMLResponse)
-def vamana_form(request: Request):
-    return templates.TemplateResponse("Vamana_form.html", {"request": request})
-
-@app.post("/vamana/predict", response_class=HTMLResponse)
-def predict_vamana(
-    request: Request,
-    Concentration: str = Form(...),
-    Sleep_Quality: str = Form(...),
-    Digestion: str = Form(...),
-    Flexibility: str = Form("Average"),
-    Energy_Level: str = Form(...),
-    Appetite: str = Form(...),
-    Stress_Level: str = Form(...),
-    Physical_Activity: str = Form(...),
-    Hydration: str = Form(...),
-    Mood_Swings: str = Form(...),
-    Mood: str = Form(...),
-    Nausea: str = Form(...),
-    Acidity: str = Form(...),
-    Weight_Gain: str = Form(...),
-    Food_Intolerance: str = Form(...),
-    Bloating: str = Form(...)
-):
-    try:
-        form_data = {
-            "Concentration": [Concentration],
-            "Sleep_Quality": [Sleep_Quality],
-            "Digestion": [Digestion],
-            "Flexibility": [Flexibility],
-            "Energy_Level": [Energy_Level],
-            "Appetite": [Appetite],
-            "Stress_Level": [Stress_Level],
-            "Physical_Activity": [Physical_Activity],
-            "Hydration": [Hydration],
-            "Mood_Swings": [Mood_Swings],
-            "Mood": [Mood],
-            "Nausea": [Nausea],
-            "Acidity": [Acidity],
-            "Weight_Gain": [Weight_Gain],
-            "Food_Intolerance": [Food_Intolerance],
-            "Bloating": [Bloating]
-        }
-        
-        df_vamana = pd.DataFrame(form_data)
-        df_general = pd.DataFrame({f: form_data[f] for f in general_features})
-        
-        vamana_pred = models["vamana"].predict(df_vamana)
-        general_pred = models["general"].predict(df_general)
-        
-        kapha_level = vamana_pred[0] if vamana_pred.ndim == 1 else vamana_pred[0][0]
-        overall_improvement = vamana_pred[0][1] if (vamana_pred.ndim == 2 and vamana_pred.shape[1] > 1) else None
-        general_improvement = general_pred[0]
-        
-        global last_results
-        last_results = {
-            "therapy": "Vamana",
-            "kapha_level": kapha_level,
-            "overall_improvement": overall_improvement,
-            "general_improvement": general_improvement
-        }
-        
-        return RedirectResponse(url="/results/vamana", status_code=303)
-        
-    except Exception as e:
-        return HTMLResponse(f"<h3 style='color:red;'>❌ Error: {e}</h3>")
+async def read_fields(request):
+    """Form fields, or a JSON object of them"""
+    if request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            payload = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Request body is not valid JSON")
+        if not isinstance(payload, dict):
+            raise SchemaValidationError([{"type": "dict_type", "loc": ["body"], "msg": "Expected a JSON object of feature values", "input": None}])
+        return payload
+    return await request.form()
 
-# Virechana therapy routes
-@app.get("/virechana", response_class=HTMLResponse)
-def virechana_form(request: Request):
-    return templates.TemplateResponse("Virechana_form.html", {"request": request})
-
-@app.post("/virechana/predict", response_class=HTMLResponse)
-def predict_virechana(
-    request: Request,
-    Concentration: str = Form(...),
-    Sleep_Quality: str = Form(...),
-    Digestion: str = Form(...),
-    Flexibility: str = Form("Average"),
-    Energy_Level: str = Form(...),
-    Appetite: str = Form(...),
-    Stress_Level: str = Form(...),
-    Physical_Activity: str = Form(...),
-    Hydration: str = Form(...),
-    Mood_Swings: str = Form(...),
-    Mood: str = Form(...),
-    Acidity: str = Form(...),
-    Heartburn: str = Form(...),
-    Skin_Issues: str = Form(...),
-    Body_Heat: str = Form(...),
-    Irritability: str = Form(...)
-):
+async def predict_therapy(request, therapy):
+    """Decode one patient's answers, score them with the therapy and General models, and respond"""
+    observe_parse(request, therapy)
     try:
-        form_data = {
-            "Concentration": [Concentration],
-            "Sleep_Quality": [Sleep_Quality],
-            "Digestion": [Digestion],
-            "Flexibility": [Flexibility],
-            "Energy_Level": [Energy_Level],
-            "Appetite": [Appetite],
-            "Stress_Level": [Stress_Level],
-            "Physical_Activity": [Physical_Activity],
-            "Hydration": [Hydration],
-            "Mood_Swings": [Mood_Swings],
-            "Mood": [Mood],
-            "Acidity": [Acidity],
-            "Heartburn": [Heartburn],
-            "Skin_Issues": [Skin_Issues],
-            "Body_Heat": [Body_Heat],
-            "Irritability": [Irritability]
-        }
-        
-        df_virechana = pd.DataFrame(form_data)
-        df_general = pd.DataFrame({f: form_data[f] for f in general_features})
-        
-        virechana_pred = models["virechana"].predict(df_virechana)
-        general_pred = models["general"].predict(df_general)
+        with stage_latency.time(therapy, "decode"):
+            decoder, general_columns = therapy_codec(therapy)
+            fields = await read_fields(request)
+            patient = patient_id(request, fields)
+            codes = decoder.decode(fields)
         
-        pitta_level = virechana_pred[0] if virechana_pred.ndim == 1 else virechana_pred[0][0]
-        overall_improvement = virechana_pred[0][1] if (virechana_pred.ndim == 2 and virechana_pred.shape[1] > 1) else None
-        general_improvement = general_pred[0]
+        therapy_pred = (await cached_predict(therapy, codes, therapy))[0]
+        general_pred = await cached_predict("general", codes[general_columns], therapy)
         
-        global last_results
-        last_results = {
-            "therapy": "Virechana",
-            "pitta_level": pitta_level,
-            "overall_improvement": overall_improvement,
-            "general_improvement": general_improvement
+        results = {
+            "therapy": model_files[therapy],
+            f"{therapy_dosha[therapy]}_level": therapy_pred[0],
+            "dosha_level": therapy_pred[0],
+            "overall_improvement": therapy_pred[1] if len(therapy_pred) > 1 else None,
+            "general_improvement": general_pred[0][0],
+            "model_version": {therapy: model_manager.version(therapy), "general": model_manager.version("general")}
         }
         
-        return RedirectResponse(url="/results/virechana", status_code=303)
+        values = decoder.values(codes)
+        if explanations_enabled:
+            try:
+                with stage_latency.time(therapy, "explain_total"):
+                    results["explanation"] = await explain_therapy(therapy, codes, general_columns, values)
+            except (Overloaded, OSError, ValueError) as e:
+                # The scores stand on their own; show them without the breakdown
+                prediction_errors.inc(therapy, f"explain_{type(e).__name__}")
+        response = await respond_with_result(request, therapy, values, results)
+        if session_history is not None and patient is not None:
+            session_history.record(patient, therapy, codes, results, rid=versioned_result_id(therapy, values, results))
+        return response
         
+    except SchemaValidationError as e:
+        prediction_errors.inc(therapy, type(e).__name__)
+        raise RequestValidationError(e.errors)
+    except (Overloaded, HTTPException):
+        raise
     except Exception as e:
+        prediction_errors.inc(therapy, type(e).__name__)
         return HTMLResponse(f"<h3 style='color:red;'>❌ Error: {e}</h3>")
 
-# Raktamokshana therapy routes
-@app.get("/raktamokshana", response_class=HTMLResponse)
-def raktamokshana_form(request: Request):
-    return templates.TemplateResponse("Raktamokshana.html", {"request": request})
-
-@app.post("/raktamokshana/predict", response_class=HTMLResponse)
-def predict_raktamokshana(
-    request: Request,
-    Concentration: str = Form(...),
-    Sleep_Quality: str = Form(...),
-    Digestion: str = Form(...),
-    Flexibility: str = Form("Average"),
-    Energy_Level: str = Form(...),
-    Appetite: str = Form(...),
-    Stress_Level: str = Form(...),
-    Physical_Activity: str = Form(...),
-    Hydration: str = Form(...),
-    Mood_Swings: str = Form(...),
-    Mood: str = Form(...),
-    Skin_Redness: str = Form(...),
-    Joint_Pain: str = Form(...),
-    Inflammation: str = Form(...),
-    Blood_Pressure: str = Form(...),
-    Circulation: str = Form(...)
-):
+WHATIF_MAX_VARIANTS = int(os.environ.get("WHATIF_MAX_VARIANTS", 2048))
+
+async def whatif_therapy(request, therapy):
+    """Score every one-answer (and with ?pairs=true, two-answer) change of a patient's input in one batch"""
+    params = request.query_params
+    pairs = params.get("pairs", "false").lower() in ("1", "true", "yes")
     try:
-        form_data = {
-            "Concentration": [Concentration],
-            "Sleep_Quality": [Sleep_Quality],
-            "Digestion": [Digestion],
-            "Flexibility": [Flexibility],
-            "Energy_Level": [Energy_Level],
-            "Appetite": [Appetite],
-            "Stress_Level": [Stress_Level],
-            "Physical_Activity": [Physical_Activity],
-            "Hydration": [Hydration],
-            "Mood_Swings": [Mood_Swings],
-            "Mood": [Mood],
-            "Skin_Redness": [Skin_Redness],
-            "Joint_Pain": [Joint_Pain],
-            "Inflammation": [Inflammation],
-            "Blood_Pressure": [Blood_Pressure],
-            "Circulation": [Circulation]
-        }
-        
-        df_raktamokshana = pd.DataFrame(form_data)
-        df_general = pd.DataFrame({f: form_data[f] for f in general_features})
-        
-        raktamokshana_pred = models["raktamokshana"].predict(df_raktamokshana)
-        general_pred = models["general"].predict(df_general)
-        
-        pitta_level = raktamokshana_pred[0] if raktamokshana_pred.ndim == 1 else raktamokshana_pred[0][0]
-        overall_improvement = raktamokshana_pred[0][1] if (raktamokshana_pred.ndim == 2 and raktamokshana_pred.shape[1] > 1) else None
-        general_improvement = general_pred[0]
-        
-        global last_results
-        last_results = {
-            "therapy": "Raktamokshana",
-            "pitta_level": pitta_level,
-            "overall_improvement": overall_improvement,
-            "general_improvement": general_improvement
+        max_variants = max(1, min(int(params.get("max_variants", WHATIF_MAX_VARIANTS)), WHATIF_MAX_VARIANTS))
+        limit = int(params.get("limit", 20))
+    except ValueError:
+        raise HTTPException(status_code=422, detail="max_variants and limit must be integers")
+    observe_parse(request, therapy)
+    try:
+        decoder, general_columns = therapy_codec(therapy)
+        codes = decoder.decode(await read_fields(request))
+    except SchemaValidationError as e:
+        raise RequestValidationError(e.errors)
+    model, general = model_manager.get(therapy), model_manager.get("general")
+    names = output_names(therapy)[:model.n_outputs] + ["general_improvement"]
+    rank = params.get("rank", names[0])
+    if rank not in names:
+        raise HTTPException(status_code=422, detail=f"rank must be one of {', '.join(names)}")
+    r = names.index(rank)
+    with stage_latency.time(therapy, "whatif"):
+        baseline, outputs, changes, truncated = await inference_pool.run(
+            sweep, model, general, general_columns, codes, pairs, max_variants, r
+        )
+    deltas = outputs - baseline
+    # Best first: the largest drop of a dosha level, the largest gain of an improvement
+    lower_is_better = BETTER["dosha_level" if r == 0 else rank] == "lower"
+    order = np.argsort(deltas[:, r] if lower_is_better else -deltas[:, r], kind="stable")[:max(limit, 0)]
+    variants = [
+        {
+            "changes": [
+                {"feature": decoder.feature_names[j], "from": decoder.labels[j][a], "to": decoder.labels[j][b], "steps": b - a}
+                for j, a, b in changes[i]
+            ],
+            **{name: float(outputs[i, k]) for k, name in enumerate(names)},
+            "delta": {name: float(deltas[i, k]) for k, name in enumerate(names)},
         }
-        
-        return RedirectResponse(url="/results/raktamokshana", status_code=303)
-        
-    except Exception as e:
-        return HTMLResponse(f"<h3 style='color:red;'>❌ Error: {e}</h3>")
+        for i in order
+    ]
+    return {
+        "therapy": therapy,
+        "rank_by": rank,
+        "baseline": {name: float(baseline[k]) for k, name in enumerate(names)},
+        "variants_scored": len(changes),
+        # Variants the max_variants cap left out, so a partial sweep is never mistaken for a full one
+        "truncated": truncated,
+        "variants": variants,
+    }
+
+# Form page and predict routes for every therapy, generated from its schema
+def add_therapy_routes(therapy):
+    def show_form(request: Request):
+        return form_page(request, therapy)
+
+    async def predict(request: Request):
+        return await predict_therapy(request, therapy)
+
+    async def whatif(request: Request):
+        return await whatif_therapy(request, therapy)
+
+    app.add_api_route(f"/{therapy}", show_form, methods=["GET"], response_class=HTMLResponse, name=f"{therapy}_form")
+    app.add_api_route(f"/{therapy}/predict", predict, methods=["POST"], response_class=HTMLResponse, name=f"predict_{therapy}")
+    app.add_api_route(f"/{therapy}/whatif", whatif, methods=["POST"], name=f"whatif_{therapy}")
+
+for therapy in therapy_features:
+    add_therapy_routes(therapy)
+
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process is up and serving HTTP"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: every model is loaded and warmed (always ready with lazy loading)"""
+    if lazy_loading or model_manager.ready():
+        return {"status": "ready"}
+    return JSONResponse(status_code=503, content={"status": "loading", **model_manager.stats()})
+
+# POST /admin/models/reload with X-Admin-Token: $ADMIN_TOKEN reloads every model here and,
+# through the shared reload-request file, in every other worker
+admin_token = os.environ.get("ADMIN_TOKEN")
+
+@app.post("/admin/models/reload")
+async def reload_models(request: Request):
+    """Load, warm, check and swap in every model's current artifacts without dropping requests"""
+    require_token(request, admin_token, "X-Admin-Token", "ADMIN_TOKEN")
+    records = await asyncio.to_thread(model_manager.request_reload)
+    return {"reloads": records, "versions": {name: entry.version for name, entry in model_manager.versions.items()}}
+
+@app.get("/models/stats")
+def models_stats():
+    """Cold-start, per-model load/warmup and first-request timings"""
+    return model_manager.stats()
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Hit/miss/eviction counters of the shared prediction cache"""
+    return prediction_cache.stats()
+
+@app.get("/inference/stats")
+def inference_stats():
+    """Pending, completed and rejected calls of the bounded inference pool"""
+    return inference_pool.stats()
+
+@app.get("/patients/{patient}/sessions")
+def patient_sessions(request: Request, patient: str, therapy: Optional[str] = None, since: Optional[float] = None,
+                     until: Optional[float] = None, limit: int = 1000):
+    """A patient's recorded sessions (answer codes and model outputs), oldest first"""
+    require_history_token(request)
+    if session_history is None:
+        raise HTTPException(status_code=404, detail="Session history is disabled")
+    if therapy is not None:
+        therapy = get_therapy(therapy)
+    sessions = session_history.sessions(patient, therapy, since, until, limit=min(max(limit, 1), 10000))
+    return {"patient": patient, "count": len(sessions), "sessions": sessions}
+
+@app.get("/patients/{patient}/trend")
+def patient_trend(request: Request, patient: str, therapy: Optional[str] = None):
+    """Running per-therapy aggregates of a patient's sessions, without scanning their history"""
+    require_history_token(request)
+    if session_history is None:
+        raise HTTPException(status_code=404, detail="Session history is disabled")
+    if therapy is not None:
+        therapy = get_therapy(therapy)
+    trend = session_history.trend(patient, therapy)
+    if not trend:
+        raise HTTPException(status_code=404, detail=f"No sessions recorded for patient {patient!r}")
+    return {"patient": patient, "therapies": trend}
+
+@app.get("/sessions/stats")
+def sessions_stats():
+    """Queue depth and write counters of the session-history writer"""
+    return session_history.stats() if session_history is not None else {"enabled": False}
+
+@app.get("/batching/stats")
+def batching_stats():
+    """Queue depth and batch-size counters of each model's micro-batcher"""
+    return {name: batcher.stats() for name, batcher in batchers.items()}
+
+model_seconds = metrics.gauge("ayursutra_model_seconds", "Time spent loading and warming each model", ("model", "phase"))
+cold_start_seconds = metrics.gauge("ayursutra_cold_start_seconds", "Time from process start until every model was ready")
+models_ready = metrics.gauge("ayursutra_models_ready", "1 once every model is loaded and warmed")
+inference_pending = metrics.gauge("ayursutra_inference_pending", "Calls running or queued on the inference pool")
+inference_rejected = metrics.gauge("ayursutra_inference_rejected", "Calls rejected by the inference pool since start")
+cache_lookups = metrics.gauge("ayursutra_prediction_cache_lookups", "Prediction cache lookups since start", ("result",))
+session_writes = metrics.gauge("ayursutra_session_history_rows", "Session-history rows by state", ("state",))
+
+@metrics.on_collect
+def collect_component_stats():
+    for name, seconds in list(model_manager.load_seconds.items()):
+        model_seconds.set(seconds, name, "load")
+    for name, seconds in list(model_manager.warmup_seconds.items()):
+        model_seconds.set(seconds, name, "warmup")
+    if model_manager.cold_start_seconds is not None:
+        cold_start_seconds.set(model_manager.cold_start_seconds)
+    models_ready.set(int(model_manager.ready()))
+    pool = inference_pool.stats()
+    inference_pending.set(pool["pending"])
+    inference_rejected.set(pool["rejected"])
+    cache = prediction_cache.stats()
+    cache_lookups.set(cache["hits"], "hit")
+    cache_lookups.set(cache["misses"], "miss")
+    if session_history is not None:
+        history = session_history.stats()
+        for state in ("queued", "written", "dropped"):
+            session_writes.set(history[state], state)
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Request, stage-latency, error and model-load metrics in the Prometheus text format"""
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
+
+@app.get("/debug/profiles")
+def list_profiles(request: Request, limit: int = 50):
+    """Newest request profiles: therapy, status, latency and trigger of each"""
+    require_profile_token(request)
+    return {"directory": str(profile_store.directory), "profiles": profile_store.list(limit)}
+
+@app.get("/debug/profiles/{pid}/{kind}")
+def get_profile(request: Request, pid: str, kind: str):
+    """Download one profile as pstats or flamegraph-compatible collapsed stacks"""
+    require_profile_token(request)
+    path = profile_store.path(pid, kind)
+    if path is None:
+        raise HTTPException(status_code=404, detail="No such profile")
+    media_type = "text/plain; charset=utf-8" if kind == "collapsed" else "application/octet-stream"
+    return FileResponse(path, media_type=media_type, filename=path.name)
 
 # Results routes
 @app.get("/results/{therapy}", response_class=HTMLResponse)
-def show_results(request: Request, therapy: str):
-    global last_results
-    if 'last_results' not in globals() or not last_results:
+def show_results_legacy(therapy: str):
+    # Results are addressed by ID now; old bookmarks go back to therapy selection
+    return RedirectResponse(url="/")
+
+# A plain def: FastAPI runs it on its threadpool, so the store lookup stays off the event loop
+@app.get("/results/{therapy}/{rid}", response_class=HTMLResponse)
+def show_results(request: Request, therapy: str, rid: str):
+    therapy = therapy.lower()
+    if therapy not in compiled_results:
         return RedirectResponse(url="/")
     
-    template_map = {
-        "basti": "result_basti.html",
-        "nasya": "result_nasya.html",
-        "vamana": "result_vamana.html",
-        "virechana": "result_virechana.html",
-        "raktamokshana": "result_raktamokshana.html"
-    }
+    # Same ID, same answers, same result: let browsers and proxies keep it
+    etag = f'"{rid}"'
+    cache_headers = {"Cache-Control": f"private, max-age={result_ttl}, immutable", "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=cache_headers)
     
-    template_name = template_map.get(therapy.lower())
-    if not template_name:
+    results = result_store.get(rid)
+    if results is None:
         return RedirectResponse(url="/")
     
-    return templates.TemplateResponse(
-        template_name,
-        {
-            "request": request,
-            **last_results
+    versions = results.get("model_version") or {}
+    if versions:
+        cache_headers["X-Model-Version"] = ",".join(f"{name}={version}" for name, version in versions.items())
+    return render_result(therapy, results, headers=cache_headers)
+
+# JSON batch API
+def records_to_columns(therapy, payload):
+    """Validate a list of records or an object of equal-length arrays into therapy_features columns"""
+    features = therapy_features[therapy]
+    if isinstance(payload, list):
+        if not all(isinstance(r, dict) for r in payload):
+            raise HTTPException(status_code=422, detail="Expected a JSON array of objects")
+        missing = sorted({f for r in payload for f in features if f not in r and f not in feature_defaults})
+        columns = {f: [r.get(f, feature_defaults.get(f)) for r in payload] for f in features}
+        n_rows = len(payload)
+    elif isinstance(payload, dict):
+        missing = [f for f in features if f not in payload and f not in feature_defaults]
+        lengths = {len(v) for f, v in payload.items() if f in features and isinstance(v, list)}
+        if any(f in payload and not isinstance(payload[f], list) for f in features) or len(lengths) > 1:
+            raise HTTPException(status_code=422, detail="Columnar input must map each feature to an array of equal length")
+        n_rows = lengths.pop() if lengths else 0
+        columns = {f: payload.get(f, [feature_defaults.get(f)] * n_rows) for f in features}
+    else:
+        raise HTTPException(status_code=422, detail="Expected a JSON array of records or an object of arrays")
+    if missing:
+        raise HTTPException(status_code=422, detail=f"Missing features for {therapy}: {', '.join(missing)}")
+    # Answers are category labels; numbers, nulls and nested values would only fail later in the encoder
+    not_strings = [f for f, values in columns.items() if not all(isinstance(v, str) for v in values)]
+    if not_strings:
+        raise HTTPException(status_code=422, detail=f"Feature values must be strings: {', '.join(not_strings)}")
+    return columns, n_rows
+
+def score_batch(therapy, columns):
+    """Run one vectorized predict per model over a whole batch of columns"""
+    try:
+        with model_manager.use(therapy) as model, model_manager.use("general") as general:
+            therapy_pred = model.predict(columns)
+            general_pred = general.predict(columns)
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {
+        "dosha_level": therapy_pred[:, 0].tolist(),
+        "overall_improvement": therapy_pred[:, 1].tolist() if therapy_pred.shape[1] > 1 else None,
+        "general_improvement": general_pred[:, 0].tolist()
+    }
+
+def get_therapy(therapy):
+    therapy = therapy.lower()
+    if therapy not in therapy_features:
+        raise HTTPException(status_code=404, detail=f"Unknown therapy: {therapy}")
+    return therapy
+
+@app.post("/api/v1/{therapy}/predict")
+async def api_predict(therapy: str, request: Request):
+    """Score a JSON array of records, or an object of feature arrays, in one batch"""
+    therapy = get_therapy(therapy)
+    try:
+        payload = json.loads(await request.body())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Request body is not valid JSON")
+    columns, n_rows = records_to_columns(therapy, payload)
+    if n_rows == 0:
+        result = {"dosha_level": [], "overall_improvement": [], "general_improvement": []}
+    else:
+        result = await inference_pool.run(score_batch, therapy, columns)
+    return {"therapy": therapy, "dosha": therapy_dosha[therapy], "count": n_rows, **result}
+
+def explain_batch(therapy, columns):
+    """Contributions of every row, as {output: {feature: [per-row contribution]}}"""
+    explained = {}
+    for name, outputs in ((therapy, output_names(therapy)), ("general", ["general_improvement"])):
+        explainer = get_explainer(name)
+        try:
+            codes = explainer.model.encode(columns)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        contributions = explainer.contributions(codes)
+        for o, output in enumerate(outputs[:explainer.n_outputs]):
+            explained[output] = {
+                "expected_value": float(explainer.expected_value[o]),
+                "contributions": {f: contributions[:, j, o].tolist() for j, f in enumerate(explainer.feature_names)},
+            }
+    return explained
+
+@app.post("/api/v1/{therapy}/explain")
+async def api_explain(therapy: str, request: Request):
+    """Per-feature contributions to each output for a batch of records (same body as /predict)"""
+    therapy = get_therapy(therapy)
+    try:
+        payload = json.loads(await request.body())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Request body is not valid JSON")
+    columns, n_rows = records_to_columns(therapy, payload)
+    if n_rows == 0:
+        return {"therapy": therapy, "dosha": therapy_dosha[therapy], "count": 0, "outputs": {}}
+    outputs = await inference_pool.run(explain_batch, therapy, columns)
+    return {"therapy": therapy, "dosha": therapy_dosha[therapy], "count": n_rows, "outputs": outputs}
+
+NDJSON_CHUNK_ROWS = 1024
+
+class DuplexStreamingResponse(StreamingResponse):
+    """StreamingResponse whose body iterator may keep reading the request body.
+
+    The stock class consumes receive() to watch for disconnects, which would
+    swallow the request chunks; here a disconnect surfaces from request.stream().
+    """
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+@app.post("/api/v1/{therapy}/predict/ndjson")
+async def api_predict_ndjson(therapy: str, request: Request):
+    """Stream NDJSON records in and NDJSON predictions out, scoring fixed-size chunks"""
+    therapy = get_therapy(therapy)
+
+    async def score_lines(lines):
+        records = [json.loads(line) for line in lines]
+        columns, _ = records_to_columns(therapy, records)
+        result = await inference_pool.run(score_batch, therapy, columns)
+        overall = result["overall_improvement"] or [None] * len(records)
+        return "".join(
+            json.dumps({"dosha_level": d, "overall_improvement": o, "general_improvement": g}) + "\n"
+            for d, o, g in zip(result["dosha_level"], overall, result["general_improvement"])
+        )
+
+    async def stream():
+        buffer, lines = b"", []
+        try:
+            async for chunk in request.stream():
+                buffer += chunk
+                *complete, buffer = buffer.split(b"\n")
+                lines.extend(line for line in complete if line.strip())
+                while len(lines) >= NDJSON_CHUNK_ROWS:
+                    yield await score_lines(lines[:NDJSON_CHUNK_ROWS])
+                    del lines[:NDJSON_CHUNK_ROWS]
+            if buffer.strip():
+                lines.append(buffer)
+            if lines:
+                yield await score_lines(lines)
+        except HTTPException as e:
+            yield json.dumps({"error": e.detail}) + "\n"
+        except ValueError as e:
+            yield json.dumps({"error": f"Invalid NDJSON line: {e}"}) + "\n"
+        except Overloaded as e:
+            yield json.dumps({"error": str(e), "retry_after": e.retry_after}) + "\n"
+        except ClientDisconnect:
+            return
+
+    return DuplexStreamingResponse(stream(), media_type="application/x-ndjson")
+
+# All five therapy models fused into one evaluator over the union of their features
+all_therapy_features = list(dict.fromkeys(f for features in therapy_features.values() for f in features))
+all_therapies_schema = TherapySchema("all", all_therapy_features, defaults=feature_defaults)
+fused = None
+
+def get_fused():
+    """Build (once) the fused therapy evaluator, the General model's columns within it and its decoder"""
+    global fused
+    if fused is None:
+        fused_therapies, fused_slices = fuse_compiled({t: model_manager.get(t) for t in therapy_features})
+        general_columns = [fused_therapies.feature_names.index(f) for f in model_manager.get("general").feature_names]
+        decoder = all_therapies_schema.bind(fused_therapies.feature_names, fused_therapies.categories)
+        model_manager.warmup(fused_therapies)
+        fused = fused_therapies, fused_slices, general_columns, decoder
+    return fused
+
+model_manager.on_ready(get_fused)
+
+def refresh_derived(name):
+    """After a reload: drop what was built from the old version, then rebuild it off the request path"""
+    global fused
+    for therapy in list(therapy_codecs):
+        if name in (therapy, "general"):
+            therapy_codecs.pop(therapy, None)
+    if name in therapy_features:
+        fused = None
+        get_fused()
+    if explanations_enabled:
+        try:
+            get_explainer(name)
+        except Exception as e:
+            print(f"Explanations unavailable for {name}: {e}")
+
+model_manager.on_swap(refresh_derived)
+
+def score_all(fields):
+    """Decode one patient's answers once and score every therapy plus the General model from the same codes"""
+    fused_therapies, fused_slices, general_columns, decoder = get_fused()
+    codes = decoder.decode(fields)[None, :]
+    therapy_pred = fused_therapies.predict_codes(codes)[0]
+    general_pred = model_manager.get("general").predict_codes(codes[:, general_columns])[0]
+    therapies = {}
+    for therapy, columns in fused_slices.items():
+        pred = therapy_pred[columns]
+        therapies[therapy] = {
+            "dosha": therapy_dosha[therapy],
+            "dosha_level": float(pred[0]),
+            "overall_improvement": float(pred[1]) if len(pred) > 1 else None
         }
-    )
+    return {"general_improvement": float(general_pred[0]), "therapies": therapies}
+
+@app.post("/predict_all")
+async def predict_all(request: Request):
+    """Score one patient's answers (JSON object or form fields) under every therapy in one pass"""
+    try:
+        fields = await read_fields(request)
+        return await inference_pool.run(score_all, fields)
+    except SchemaValidationError as e:
+        # Missing, unknown or non-string values, reported per field like the form routes
+        raise RequestValidationError(e.errors)
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
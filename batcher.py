@@ -0,0 +1,108 @@
+"""Async micro-batching for concurrent single-row predictions.
+
+Each ``MicroBatcher`` owns an asyncio queue for one model. Requests submit one
+encoded row and await a future; a worker task drains the queue into a batch
+until it holds ``max_batch_size`` rows or ``max_wait`` seconds have passed
+since the first row arrived, scores the batch with a single ``predict_codes``
+call in a worker thread (or through ``runner``), and resolves every future
+with its own row. A full queue raises ``asyncio.QueueFull`` at submit time.
+"""
+import asyncio
+import time
+
+import numpy as np
+
+
+class MicroBatcher:
+    def __init__(self, predict_codes, max_batch_size=64, max_wait=0.002, max_queue=1024, runner=None):
+        self.predict_codes = predict_codes
+        self.runner = runner
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self._loop = None
+        self._queue = None
+        self._worker = None
+        self.batches = 0
+        self.rows = 0
+        self.largest_batch = 0
+        self.errors = 0
+        self.rejected = 0
+        self.busy_seconds = 0.0
+
+    def _ensure_worker(self):
+        # Queues and tasks are bound to an event loop, so rebuild them if the loop changed
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._worker = loop.create_task(self._run())
+
+    async def submit(self, codes):
+        """Queue one row of ordinal codes and wait for its prediction row."""
+        self._ensure_worker()
+        future = self._loop.create_future()
+        try:
+            self._queue.put_nowait((codes, future))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._flush(loop, batch)
+
+    async def _flush(self, loop, batch):
+        X = np.stack([codes for codes, _ in batch])
+        start = time.perf_counter()
+        try:
+            if self.runner is not None:
+                predictions = await self.runner(self.predict_codes, X)
+            else:
+                predictions = await loop.run_in_executor(None, self.predict_codes, X)
+        except Exception as e:
+            self.errors += 1
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.busy_seconds += time.perf_counter() - start
+        self.batches += 1
+        self.rows += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        for (_, future), row in zip(batch, predictions):
+            if not future.done():
+                future.set_result(row)
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "max_queue": self.max_queue,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "rows": self.rows,
+            "mean_batch_size": self.rows / self.batches if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "busy_seconds": self.busy_seconds,
+        }
@@ -0,0 +1,308 @@
+"""Reproducible benchmarks for the inference and HTTP serving paths.
+
+Subcommands::
+
+    python bench.py models  [--rows 1 64 1024]        # pickled vs compiled predict per model
+    python bench.py http    [--iterations 200]        # POST -> 303 -> GET results, in process
+    python bench.py load    --url http://127.0.0.1:8000 [--concurrency 1 8 32 64]
+    python bench.py compare benchmarks/baseline.json benchmarks/latest.json [--threshold 0.1]
+
+``models``, ``http`` and ``load`` write ``benchmarks/latest.json`` (``--output``)
+and, with ``--save-baseline``, ``benchmarks/baseline.json``. Every result is a
+flat ``name -> {"value", "unit", "better"}`` entry so ``compare`` can flag any
+metric that moved the wrong way by more than ``--threshold`` (a fraction);
+it exits with status 1 when something regressed. Inputs are random valid
+answers from a fixed seed, so runs on the same machine are comparable. The
+``http`` and ``load`` modes need ``httpx``.
+"""
+import argparse
+import asyncio
+import json
+import os
+import pickle
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+base_dir = Path(__file__).resolve().parent
+BENCH_DIR = base_dir / "benchmarks"
+BASELINE_PATH = BENCH_DIR / "baseline.json"
+LATEST_PATH = BENCH_DIR / "latest.json"
+THERAPIES = ("basti", "nasya", "vamana", "virechana", "raktamokshana")
+
+
+def random_records(model, n_rows, rng):
+    """``n_rows`` random answer dicts using the model's own categories."""
+    columns = {f: rng.choice(model.categories[f], size=n_rows) for f in model.feature_names}
+    return [{f: str(columns[f][i]) for f in model.feature_names} for i in range(n_rows)]
+
+
+def time_per_call(fn, repeat=5, min_seconds=0.2):
+    """Median seconds per call over ``repeat`` runs, each long enough to be measurable."""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds / repeat or number >= 1 << 20:
+            break
+        number *= 2
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        runs.append((time.perf_counter() - start) / number)
+    return float(np.median(runs))
+
+
+def percentile_summary(latencies, prefix):
+    latencies = np.asarray(latencies)
+    return {
+        f"{prefix}.p50": {"value": float(np.percentile(latencies, 50)), "unit": "s", "better": "lower"},
+        f"{prefix}.p95": {"value": float(np.percentile(latencies, 95)), "unit": "s", "better": "lower"},
+        f"{prefix}.p99": {"value": float(np.percentile(latencies, 99)), "unit": "s", "better": "lower"},
+    }
+
+
+def bench_models(args):
+    import pandas as pd
+
+    from therapies import model_files
+    from model_manager import ModelManager
+
+    manager = ModelManager(base_dir, model_files)
+    rng = np.random.default_rng(args.seed)
+    results = {}
+    for name, stem in model_files.items():
+        compiled = manager.get(name)
+        with open(base_dir / f"{stem}_model.pkl", "rb") as f:
+            pipeline = pickle.load(f)
+        for n_rows in args.rows:
+            records = random_records(compiled, n_rows, rng)
+            frame = pd.DataFrame(records, columns=compiled.feature_names)
+            codes = compiled.encode(frame)
+            timings = {
+                "pickle": time_per_call(lambda: pipeline.predict(frame), args.repeat),
+                "compiled": time_per_call(lambda: compiled.predict_codes(codes), args.repeat),
+                "compiled_encode": time_per_call(lambda: compiled.predict(frame), args.repeat),
+            }
+            for variant, seconds in timings.items():
+                key = f"models.{name}.{variant}.rows={n_rows}"
+                results[key] = {"value": seconds, "unit": "s", "better": "lower"}
+                print(f"{key:48s} {seconds * 1e6:12.1f} us/call {n_rows / seconds:14.0f} rows/s")
+    return results
+
+
+async def _http_cycle(client, therapy, record):
+    response = await client.post(f"/{therapy}/predict", data=record)
+    if response.status_code != 303:
+        raise RuntimeError(f"/{therapy}/predict returned {response.status_code}: {response.text[:200]}")
+    page = await client.get(response.headers["location"])
+    if page.status_code != 200:
+        raise RuntimeError(f"{response.headers['location']} returned {page.status_code}")
+
+
+async def _bench_http(args):
+    import httpx
+
+    import app as app_module
+
+    if not app_module.model_manager.load_all():
+        raise SystemExit(f"Model loading failed: {app_module.model_manager.errors}")
+    rng = np.random.default_rng(args.seed)
+    results = {}
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for therapy in THERAPIES:
+            records = random_records(app_module.model_manager.get(therapy), args.iterations + args.warmup, rng)
+            for record in records[:args.warmup]:
+                await _http_cycle(client, therapy, record)
+            latencies = []
+            for record in records[args.warmup:]:
+                start = time.perf_counter()
+                await _http_cycle(client, therapy, record)
+                latencies.append(time.perf_counter() - start)
+            summary = percentile_summary(latencies, f"http.{therapy}.cycle")
+            results.update(summary)
+            print(f"http.{therapy:14s} p50 {summary[f'http.{therapy}.cycle.p50']['value'] * 1e3:8.2f} ms"
+                  f"  p99 {summary[f'http.{therapy}.cycle.p99']['value'] * 1e3:8.2f} ms")
+    return results
+
+
+def bench_http(args):
+    # Random answers rarely repeat, but keep the cache out of the measurement anyway
+    os.environ.setdefault("PREDICTION_CACHE_SIZE", "0")
+    # Benchmark traffic must never land in a real patient history (nor time its writer)
+    os.environ["SESSION_HISTORY"] = "off"
+    return asyncio.run(_bench_http(args))
+
+
+async def _load_level(client, requests, concurrency, duration):
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+    cursor = 0
+
+    async def worker():
+        nonlocal cursor, errors
+        while time.perf_counter() < deadline:
+            therapy, record = requests[cursor % len(requests)]
+            cursor += 1
+            start = time.perf_counter()
+            try:
+                await _http_cycle(client, therapy, record)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+
+async def _bench_load(args):
+    import httpx
+
+    from therapies import model_files
+    from model_manager import ModelManager
+
+    # Only the feature names and categories are needed to build valid answers
+    manager = ModelManager(base_dir, model_files)
+    rng = np.random.default_rng(args.seed)
+    requests = [
+        (therapy, record)
+        for therapy in THERAPIES
+        for record in random_records(manager.get(therapy), 200, rng)
+    ]
+    rng.shuffle(requests)
+    results = {}
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30) as client:
+        for concurrency in args.concurrency:
+            latencies, errors, elapsed = await _load_level(client, requests, concurrency, args.duration)
+            if not latencies:
+                raise SystemExit(f"No successful requests at concurrency {concurrency} ({errors} errors)")
+            prefix = f"load.c={concurrency}"
+            results.update(percentile_summary(latencies, prefix))
+            results[f"{prefix}.rps"] = {"value": len(latencies) / elapsed, "unit": "1/s", "better": "higher"}
+            results[f"{prefix}.errors"] = {"value": errors, "unit": "count", "better": "lower"}
+            print(f"{prefix:10s} {len(latencies) / elapsed:9.1f} req/s  p50 {np.percentile(latencies, 50) * 1e3:8.2f} ms"
+                  f"  p95 {np.percentile(latencies, 95) * 1e3:8.2f} ms  p99 {np.percentile(latencies, 99) * 1e3:8.2f} ms"
+                  f"  errors {errors}")
+    return results
+
+
+def bench_load(args):
+    return asyncio.run(_bench_load(args))
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=base_dir, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+
+def write_results(path, results, mode):
+    """Merge ``results`` into the JSON file at ``path`` so several modes can share one file."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = {"environment": {}, "results": {}}
+    if path.exists():
+        with open(path) as f:
+            data = json.load(f)
+    data["environment"][mode] = environment()
+    data["results"].update(results)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+    print(f"Wrote {len(results)} results to {path}")
+
+
+def compare(baseline_path, current_path, threshold):
+    """Print every shared metric's change; return the names that regressed beyond ``threshold``."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    with open(current_path) as f:
+        current = json.load(f)["results"]
+    regressions = []
+    for name in sorted(baseline.keys() & current.keys()):
+        before, after = baseline[name]["value"], current[name]["value"]
+        if before == 0:
+            change = 0.0 if after == 0 else float("inf")
+        else:
+            change = (after - before) / before
+        worse = change if baseline[name]["better"] == "lower" else -change
+        flag = "REGRESSION" if worse > threshold else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:48s} {before:14.6g} -> {after:14.6g} {change:+8.1%} {flag}")
+    for name in sorted(baseline.keys() - current.keys()):
+        print(f"{name:48s} missing from {current_path}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the inference and HTTP serving paths")
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+
+    def add_output_args(p):
+        p.add_argument("--output", default=str(LATEST_PATH))
+        p.add_argument("--save-baseline", action="store_true", help=f"Also write the results to {BASELINE_PATH.name}")
+        p.add_argument("--seed", type=int, default=0)
+
+    p = subparsers.add_parser("models", help="single-row and batched predict for every model")
+    p.add_argument("--rows", type=int, nargs="+", default=[1, 64, 1024])
+    p.add_argument("--repeat", type=int, default=5)
+    add_output_args(p)
+
+    p = subparsers.add_parser("http", help="full POST -> 303 -> GET cycle through an in-process ASGI client")
+    p.add_argument("--iterations", type=int, default=200)
+    p.add_argument("--warmup", type=int, default=20)
+    add_output_args(p)
+
+    p = subparsers.add_parser("load", help="closed-loop load against a running server")
+    p.add_argument("--url", default="http://127.0.0.1:8000")
+    p.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    p.add_argument("--duration", type=float, default=10.0, help="seconds per concurrency level")
+    add_output_args(p)
+
+    p = subparsers.add_parser("compare", help="flag regressions against a baseline")
+    p.add_argument("baseline", nargs="?", default=str(BASELINE_PATH))
+    p.add_argument("current", nargs="?", default=str(LATEST_PATH))
+    p.add_argument("--threshold", type=float, default=0.10)
+
+    args = parser.parse_args(argv)
+    if args.mode == "compare":
+        regressions = compare(args.baseline, args.current, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}")
+            return 1
+        return 0
+
+    results = {"models": bench_models, "http": bench_http, "load": bench_load}[args.mode](args)
+    write_results(args.output, results, args.mode)
+    if args.save_baseline:
+        write_results(BASELINE_PATH, results, args.mode)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
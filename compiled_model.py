@@ -0,0 +1,468 @@
+"""Flat-array inference for the pickled therapy pipelines.
+
+Every ``*_model.pkl`` is a ``Pipeline(ColumnTransformer(OrdinalEncoder) ->
+MultiOutputRegressor(XGBRegressor, ...))``. ``compile_pipeline`` turns one
+into plain category->code dicts plus padded NumPy node arrays covering all
+trees of all outputs, so a prediction is a handful of vectorized gathers
+instead of pandas + sklearn validation + one DMatrix per output. The trees of
+every output share one traversal, whether they come from several
+single-output boosters or from one multi-target booster (``train.py
+--multi-output``).
+
+``compact`` optionally shrinks a compiled model after training: leaves can be
+rounded to float16, splits over two equal leaves are merged, constant trees
+are folded into the base score and near-zero trees dropped. ``python
+compiled_model.py --compact`` checks every compacted model against its
+pickle on random rows before writing it; a model that fails the check has
+any previous ``.npz`` removed and gets a ``<Name>_model.rejected.json`` note
+instead, which ``ModelManager`` reports when it falls back to compiling the
+pickle.
+"""
+import hashlib
+import json
+import os
+import pickle
+import sys
+from pathlib import Path
+
+import numpy as np
+
+ARTIFACT_ARRAYS = ("roots", "feature", "threshold", "left", "right", "default_left", "value", "tree_output", "base_score")
+
+
+def encode_columns(data, feature_names, code_maps):
+    """Look up each named column's categories in ``code_maps``; returns ``(n_rows, n_features)`` float32."""
+    columns = []
+    for name, code_map in zip(feature_names, code_maps):
+        values = data[name]
+        if isinstance(values, str):
+            values = [values]
+        try:
+            columns.append([code_map[v] for v in values])
+        except KeyError as e:
+            raise ValueError(f"Found unknown category {e.args[0]!r} for feature {name!r}") from None
+    return np.array(columns, dtype=np.float32).T.reshape(-1, len(feature_names))
+
+
+class CompiledPipeline:
+    """NumPy evaluator equivalent to ``Pipeline.predict`` for one pickled model."""
+
+    def __init__(self, feature_names, categories, roots, feature, threshold, left, right,
+                 default_left, value, tree_output, base_score, max_depth):
+        self.feature_names = list(feature_names)
+        self.roots = roots
+        self.categories = {name: list(cats) for name, cats in zip(self.feature_names, categories)}
+        self.code_maps = [{cat: float(i) for i, cat in enumerate(cats)} for cats in categories]
+        self.feature = feature
+        self.threshold = threshold
+        self.children = np.stack([left, right], axis=1).ravel()
+        self.default_left = default_left
+        self.value = value
+        self.tree_output = tree_output
+        self.base_score = base_score
+        self.max_depth = max_depth
+        self.n_outputs = tree_output.shape[1]
+
+    def encode(self, data):
+        """Map a column mapping (dict of lists, DataFrame, or dict of scalars) to a float32 code matrix."""
+        return encode_columns(data, self.feature_names, self.code_maps)
+
+    def predict_codes(self, X):
+        """Score an ``(n_rows, n_features)`` array of ordinal codes."""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        n_rows, n_features = X.shape
+        flat = X.ravel()
+        row_base = (np.arange(n_rows) * n_features)[:, None]
+        node = np.broadcast_to(self.roots, (n_rows, self.roots.shape[0]))
+        has_missing = np.isnan(flat).any()
+        for _ in range(self.max_depth):
+            x = flat[row_base + self.feature[node]]
+            go_right = x >= self.threshold[node]
+            if has_missing:
+                go_right |= np.isnan(x) & ~self.default_left[node]
+            # children holds (left, right) pairs, so one gather picks the branch
+            node = self.children[2 * node + go_right]
+        out = self.value[node] @ self.tree_output
+        out += self.base_score
+        return out.astype(np.float32)
+
+    def predict(self, data):
+        """Drop-in replacement for ``Pipeline.predict`` on a DataFrame or dict of columns."""
+        return self.predict_codes(self.encode(data))
+
+
+def _booster_trees(booster):
+    model = json.loads(booster.save_raw("json"))["learner"]
+    # A multi-target booster may store one base score per target, as "[a,b]"
+    base_score = [float(v) for v in model["learner_model_param"]["base_score"].strip("[]").split(",")]
+    trees = model["gradient_booster"]["model"]["trees"]
+    tree_info = model["gradient_booster"]["model"]["tree_info"]
+    return trees, tree_info, base_score
+
+
+def _tree_depth(left, right):
+    depth = {0: 0}
+    stack = [0]
+    while stack:
+        i = stack.pop()
+        if left[i] != -1:
+            depth[left[i]] = depth[right[i]] = depth[i] + 1
+            stack.extend((left[i], right[i]))
+    return max(depth.values())
+
+
+def compile_pipeline(pipeline):
+    """Flatten a fitted OrdinalEncoder + XGBoost pipeline into a ``CompiledPipeline``."""
+    preprocessor, regressor = pipeline.steps[0][1], pipeline.steps[-1][1]
+    transformers = [t for t in preprocessor.transformers_ if t[0] != "remainder"]
+    if len(transformers) != 1 or not hasattr(transformers[0][1], "categories_"):
+        raise TypeError("Expected a single OrdinalEncoder in the pipeline preprocessor")
+    _, encoder, feature_names = transformers[0]
+    categories = [list(c) for c in encoder.categories_]
+
+    estimators = getattr(regressor, "estimators_", [regressor])
+    flat_trees, outputs, base_score = [], [], []
+    offset = 0
+    for estimator in estimators:
+        trees, tree_info, base = _booster_trees(estimator.get_booster())
+        flat_trees.extend(trees)
+        outputs.extend(offset + t for t in tree_info)
+        n_targets = max(tree_info) + 1
+        base_score.extend(base * n_targets if len(base) == 1 else base)
+        offset += n_targets
+
+    n_trees = len(flat_trees)
+    width = max(len(t["left_children"]) for t in flat_trees)
+    size = n_trees * width
+    feature = np.zeros(size, dtype=np.intp)
+    threshold = np.full(size, np.inf, dtype=np.float32)
+    left = np.arange(size, dtype=np.intp)
+    right = np.arange(size, dtype=np.intp)
+    default_left = np.zeros(size, dtype=bool)
+    value = np.zeros(size, dtype=np.float64)
+    max_depth = 0
+
+    for k, tree in enumerate(flat_trees):
+        base = k * width
+        lc = np.asarray(tree["left_children"])
+        rc = np.asarray(tree["right_children"])
+        n = len(lc)
+        idx = np.arange(base, base + n)
+        internal = lc != -1
+        conditions = np.asarray(tree["split_conditions"], dtype=np.float32)
+        feature[idx[internal]] = np.asarray(tree["split_indices"])[internal]
+        threshold[idx[internal]] = conditions[internal]
+        left[idx[internal]] = base + lc[internal]
+        right[idx[internal]] = base + rc[internal]
+        default_left[idx] = np.asarray(tree["default_left"], dtype=bool)
+        # Leaves keep pointing at themselves, so extra traversal steps are no-ops
+        value[idx[~internal]] = conditions[~internal]
+        max_depth = max(max_depth, _tree_depth(lc, rc))
+
+    tree_output = np.zeros((n_trees, offset), dtype=np.float64)
+    tree_output[np.arange(n_trees), outputs] = 1.0
+
+    roots = np.arange(n_trees, dtype=np.intp) * width
+    return CompiledPipeline(
+        feature_names, categories, roots, feature, threshold, left, right,
+        default_left, value, tree_output, np.asarray(base_score, dtype=np.float64), max_depth,
+    )
+
+
+def fuse_compiled(compiled):
+    """Stack several compiled models into one evaluator over the union of their features.
+
+    Returns ``(fused, output_slices)``; ``output_slices[name]`` selects that
+    model's columns from ``fused.predict_codes`` output. Features shared by
+    several models must use the same categories.
+    """
+    feature_names, categories = [], {}
+    for name, model in compiled.items():
+        for feature in model.feature_names:
+            if feature not in categories:
+                feature_names.append(feature)
+                categories[feature] = model.categories[feature]
+            elif categories[feature] != model.categories[feature]:
+                raise ValueError(f"Feature {feature!r} has different categories in {name!r}")
+    union_index = {feature: j for j, feature in enumerate(feature_names)}
+
+    parts = {key: [] for key in ("roots", "feature", "threshold", "left", "right", "default_left", "value", "base_score")}
+    output_slices = {}
+    node_offset = output_offset = 0
+    for name, model in compiled.items():
+        remap = np.array([union_index[f] for f in model.feature_names], dtype=np.intp)
+        parts["roots"].append(model.roots + node_offset)
+        parts["feature"].append(remap[model.feature])
+        parts["threshold"].append(model.threshold)
+        parts["left"].append(model.children[0::2] + node_offset)
+        parts["right"].append(model.children[1::2] + node_offset)
+        parts["default_left"].append(model.default_left)
+        parts["value"].append(model.value)
+        parts["base_score"].append(model.base_score)
+        output_slices[name] = slice(output_offset, output_offset + model.n_outputs)
+        node_offset += len(model.value)
+        output_offset += model.n_outputs
+
+    tree_output = np.zeros((sum(len(r) for r in parts["roots"]), output_offset), dtype=np.float64)
+    tree_offset = 0
+    for name, model in compiled.items():
+        n_trees = len(model.roots)
+        tree_output[tree_offset:tree_offset + n_trees, output_slices[name]] = model.tree_output
+        tree_offset += n_trees
+
+    fused = CompiledPipeline(
+        feature_names, [categories[f] for f in feature_names],
+        *(np.concatenate(parts[key]) for key in ("roots", "feature", "threshold", "left", "right", "default_left", "value")),
+        tree_output, np.concatenate(parts["base_score"]), max(m.max_depth for m in compiled.values()),
+    )
+    return fused, output_slices
+
+
+def load_compiled(path):
+    """Unpickle a ``*_model.pkl`` pipeline and compile it."""
+    with open(path, "rb") as f:
+        return compile_pipeline(pickle.load(f))
+
+
+def file_sha256(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _leaf_tree(value):
+    return ("leaf", value)
+
+
+def _simplify(i, feature, threshold, left, right, default_left, value):
+    """Tree below node ``i`` as nested tuples, with splits whose two leaves agree merged away."""
+    if left[i] == i:
+        return _leaf_tree(value[i])
+    lo = _simplify(left[i], feature, threshold, left, right, default_left, value)
+    hi = _simplify(right[i], feature, threshold, left, right, default_left, value)
+    if lo[0] == "leaf" and hi[0] == "leaf" and lo[1] == hi[1]:
+        return lo
+    return ("split", feature[i], threshold[i], default_left[i], lo, hi)
+
+
+def _max_abs_leaf(tree):
+    if tree[0] == "leaf":
+        return abs(tree[1])
+    return max(_max_abs_leaf(tree[4]), _max_abs_leaf(tree[5]))
+
+
+def _depth(tree):
+    return 0 if tree[0] == "leaf" else 1 + max(_depth(tree[4]), _depth(tree[5]))
+
+
+def compact(compiled, prune_below=0.0, leaf_dtype=None):
+    """Shrink a compiled model; returns ``(compacted, stats)``.
+
+    Leaf values are first rounded to ``leaf_dtype`` (e.g. ``float16``), then
+    every split whose two subtrees are the same leaf is merged into that leaf.
+    Trees reduced to a single leaf are folded into ``base_score`` exactly, and
+    trees whose leaves all lie within ``prune_below`` of zero are dropped
+    (changing any prediction by at most the sum of their largest leaves).
+    The remaining trees are packed densely without per-tree padding.
+    """
+    left, right = compiled.children[0::2], compiled.children[1::2]
+    value = compiled.value
+    if leaf_dtype is not None:
+        value = value.astype(leaf_dtype).astype(np.float64)
+    base_score = compiled.base_score.astype(np.float64).copy()
+    parts = {key: [] for key in ("feature", "threshold", "left", "right", "default_left", "value")}
+    roots, tree_rows, max_depth, pruned_error = [], [], 0, np.zeros_like(base_score)
+    stats = {"trees": len(compiled.roots), "folded": 0, "pruned": 0}
+
+    def emit(tree):
+        i = len(parts["value"])
+        for key in parts:
+            parts[key].append(None)
+        if tree[0] == "leaf":
+            # Leaves point at themselves, like compile_pipeline's
+            node = (0, np.inf, i, i, False, tree[1])
+        else:
+            _, f, t, dl, lo, hi = tree
+            node = (f, t, emit(lo), emit(hi), dl, 0.0)
+        for key, v in zip(parts, node):
+            parts[key][i] = v
+        return i
+
+    for k, root in enumerate(compiled.roots):
+        tree = _simplify(root, compiled.feature, compiled.threshold, left, right, compiled.default_left, value)
+        row = compiled.tree_output[k]
+        if tree[0] == "leaf":
+            base_score += tree[1] * row
+            stats["folded"] += 1
+            continue
+        largest = _max_abs_leaf(tree)
+        if largest < prune_below:
+            pruned_error += largest * row
+            stats["pruned"] += 1
+            continue
+        roots.append(emit(tree))
+        tree_rows.append(row)
+        max_depth = max(max_depth, _depth(tree))
+
+    if not roots:
+        # Keep one constant tree so every array stays non-empty
+        roots.append(emit(_leaf_tree(0.0)))
+        tree_rows.append(np.zeros(compiled.n_outputs))
+    compacted = CompiledPipeline(
+        compiled.feature_names, [compiled.categories[f] for f in compiled.feature_names],
+        np.asarray(roots, dtype=np.intp),
+        np.asarray(parts["feature"], dtype=np.intp),
+        np.asarray(parts["threshold"], dtype=np.float32),
+        np.asarray(parts["left"], dtype=np.intp),
+        np.asarray(parts["right"], dtype=np.intp),
+        np.asarray(parts["default_left"], dtype=bool),
+        np.asarray(parts["value"], dtype=np.float64),
+        np.asarray(tree_rows, dtype=np.float64),
+        base_score,
+        max_depth,
+    )
+    stats.update({
+        "trees_kept": len(roots),
+        "nodes": len(compiled.value),
+        "nodes_kept": len(parts["value"]),
+        "max_depth": compiled.max_depth,
+        "max_depth_kept": max_depth,
+        "pruned_error_bound": pruned_error.tolist(),
+    })
+    return compacted, stats
+
+
+def check_against_pickle(compiled, pkl_path, n_rows=10000, seed=0):
+    """Compare ``compiled`` with the pickled pipeline on random valid answers.
+
+    Returns the largest absolute difference and the RMSE of each output.
+    """
+    import pandas as pd
+
+    with open(pkl_path, "rb") as f:
+        pipeline = pickle.load(f)
+    rng = np.random.default_rng(seed)
+    radices = [len(compiled.categories[f]) for f in compiled.feature_names]
+    codes = rng.integers(0, radices, size=(n_rows, len(radices)))
+    frame = pd.DataFrame({
+        f: np.asarray(compiled.categories[f], dtype=object)[codes[:, j]]
+        for j, f in enumerate(compiled.feature_names)
+    })
+    expected = np.asarray(pipeline.predict(frame), dtype=np.float64).reshape(n_rows, -1)
+    error = compiled.predict_codes(codes).astype(np.float64) - expected
+    return {
+        "rows": n_rows,
+        "max_abs_error": np.abs(error).max(axis=0).tolist(),
+        "rmse": np.sqrt((error ** 2).mean(axis=0)).tolist(),
+    }
+
+
+def save_artifact(compiled, path, source_sha256=None, leaf_dtype="float32", compaction=None):
+    """Write a compiled model to ``.npz`` so serving can load it with NumPy alone.
+
+    Node indices are stored as int32 and leaves as ``leaf_dtype``; float32 is
+    lossless for XGBoost leaves, float16 trades precision for size.
+    """
+    meta = {
+        "feature_names": compiled.feature_names,
+        "categories": [compiled.categories[f] for f in compiled.feature_names],
+        "max_depth": compiled.max_depth,
+        "source_sha256": source_sha256,
+        "leaf_dtype": leaf_dtype,
+        "compaction": compaction,
+    }
+    arrays = {
+        "roots": compiled.roots.astype(np.int32),
+        "feature": compiled.feature.astype(np.int16),
+        "threshold": compiled.threshold.astype(np.float32),
+        "left": compiled.children[0::2].astype(np.int32),
+        "right": compiled.children[1::2].astype(np.int32),
+        "default_left": compiled.default_left,
+        "value": compiled.value.astype(leaf_dtype),
+        # One-hot tree -> output assignment
+        "tree_output": compiled.tree_output.astype(np.uint8),
+        "base_score": compiled.base_score,
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+    os.replace(tmp_path, path)
+
+
+def rejection_path(npz_path):
+    """Where the export CLI notes why it did not write ``npz_path``."""
+    npz_path = Path(npz_path)
+    return npz_path.with_name(npz_path.stem + ".rejected.json")
+
+
+def read_rejection(npz_path, source_path):
+    """The export CLI's rejection note for ``npz_path``, if it still applies to ``source_path``."""
+    try:
+        note = json.loads(rejection_path(npz_path).read_text())
+    except (OSError, ValueError):
+        return None
+    return note if note.get("source_sha256") == file_sha256(source_path) else None
+
+
+def load_artifact(path, source_path=None):
+    """Load a ``.npz`` compiled model, or return None if it is missing or older than ``source_path``."""
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data["meta"]))
+        if source_path is not None and os.path.exists(source_path) and meta["source_sha256"] != file_sha256(source_path):
+            print(f"Ignoring stale {Path(path).name}: {Path(source_path).name} has changed")
+            return None
+        arrays = [data[key] for key in ARTIFACT_ARRAYS]
+    roots, feature, threshold, left, right, default_left, value, tree_output, base_score = arrays
+    return CompiledPipeline(
+        meta["feature_names"], meta["categories"], roots.astype(np.intp), feature.astype(np.intp),
+        threshold.astype(np.float32), left.astype(np.intp), right.astype(np.intp), default_left,
+        value.astype(np.float64), tree_output.astype(np.float64), base_score.astype(np.float64), meta["max_depth"],
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export every *_model.pkl next to it as <Name>_model.npz")
+    parser.add_argument("--compact", action="store_true", help="merge identical leaves and fold/prune trees")
+    parser.add_argument("--prune-below", type=float, default=0.0, help="drop trees whose leaves are all smaller than this")
+    parser.add_argument("--leaf-dtype", choices=["float64", "float32", "float16"], default="float32")
+    parser.add_argument("--check-rows", type=int, default=10000, help="rows compared against the pickle (0 skips)")
+    parser.add_argument("--tolerance", type=float, default=0.05, help="largest acceptable absolute error")
+    args = parser.parse_args()
+
+    rejected = []
+    for pkl_path in sorted(Path(__file__).resolve().parent.glob("*_model.pkl")):
+        npz_path = pkl_path.with_suffix(".npz")
+        compiled, stats = load_compiled(pkl_path), None
+        if args.compact:
+            compiled, stats = compact(compiled, prune_below=args.prune_below, leaf_dtype=args.leaf_dtype)
+            print(f"{pkl_path.stem}: {stats['trees_kept']}/{stats['trees']} trees, "
+                  f"{stats['nodes_kept']}/{stats['nodes']} nodes, depth {stats['max_depth_kept']}/{stats['max_depth']}")
+        else:
+            # Check exactly what the artifact will hold
+            compiled.value = compiled.value.astype(args.leaf_dtype).astype(np.float64)
+        if args.check_rows:
+            check = check_against_pickle(compiled, pkl_path, n_rows=args.check_rows)
+            print(f"{pkl_path.stem}: max abs error {check['max_abs_error']}, rmse {check['rmse']}")
+            if max(check["max_abs_error"]) > args.tolerance:
+                reason = f"max abs error {max(check['max_abs_error']):.4g} above tolerance {args.tolerance}"
+                print(f"Not writing {npz_path.name}: {reason}", file=sys.stderr)
+                rejection_path(npz_path).write_text(json.dumps({
+                    "reason": reason, "source_sha256": file_sha256(pkl_path), "check": check,
+                    "leaf_dtype": args.leaf_dtype, "compaction": stats,
+                }, indent=2))
+                # An older export of the same pickle would otherwise keep serving unreported
+                npz_path.unlink(missing_ok=True)
+                rejected.append(pkl_path.stem)
+                continue
+            if stats is not None:
+                stats["check"] = check
+        save_artifact(compiled, npz_path, source_sha256=file_sha256(pkl_path), leaf_dtype=args.leaf_dtype, compaction=stats)
+        rejection_path(npz_path).unlink(missing_ok=True)
+        print(f"Wrote {npz_path.name} ({os.path.getsize(npz_path) / 1024:.0f} KiB)")
+    if rejected:
+        sys.exit(f"Rejected {len(rejected)} model(s), which will be compiled from the pickle at startup: {', '.join(rejected)}")
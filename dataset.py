@@ -0,0 +1,164 @@
+"""Columnar, memory-mapped cache of the training datasets.
+
+The ``*_Feedback_Synthetic.xlsx`` files are slow to parse and store every
+answer as a repeated string. ``load_dataset`` converts a therapy's source
+(``.xlsx`` or ``.csv``) once into ``.dataset_cache/<source stem>/``:
+
+* ``codes.npy`` - ``(n_rows, n_features)`` int8 ordinal codes,
+* ``targets.npy`` - ``(n_rows, n_targets)`` float64 target columns,
+* ``meta.json`` - feature order, category dictionary, target names and the
+  source's size, mtime and SHA-256.
+
+Later loads memory-map the two arrays. The cache is rebuilt automatically
+when the source's size or mtime changes and its hash no longer matches.
+Refresh every cache with::
+
+    python dataset.py [therapy ...]
+"""
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+from compiled_model import file_sha256
+from synthetic_data import THERAPY_CONFIGS, to_frame
+
+base_dir = Path(__file__).resolve().parent
+CACHE_DIR = base_dir / ".dataset_cache"
+CSV_CHUNK_ROWS = 1 << 20
+
+
+class Dataset:
+    """Ordinal codes and targets of one therapy's dataset (usually memory-mapped)."""
+
+    def __init__(self, config, codes, targets, source=None):
+        self.config = config
+        self.codes = codes
+        self.targets = targets
+        self.source = source
+        self.feature_names = config.features
+        self.target_names = config.target_names
+
+    def __len__(self):
+        return len(self.codes)
+
+    def to_frame(self, rows=slice(None)):
+        """Selected rows as a DataFrame of category strings, like the source file."""
+        return to_frame(self.config, np.asarray(self.codes[rows]), np.asarray(self.targets[rows]))
+
+
+def _encode_frame(config, frame):
+    import pandas as pd
+
+    missing = [c for c in config.features + config.target_names if c not in frame.columns]
+    if missing:
+        raise ValueError(f"{config.name} source is missing columns: {', '.join(missing)}")
+    codes = np.empty((len(frame), len(config.features)), dtype=np.int8)
+    for j, (feature, categories) in enumerate(zip(config.features, config.categories)):
+        column = pd.Categorical(frame[feature].astype(str).str.strip(), categories=categories).codes
+        unknown = column < 0
+        if unknown.any():
+            values = sorted(set(frame[feature][unknown].astype(str)))
+            raise ValueError(f"Unknown categories for {feature!r} in {config.name} source: {values}")
+        codes[:, j] = column
+    return codes, frame[config.target_names].to_numpy(dtype=np.float64)
+
+
+def _read_source(config, source):
+    """Yield encoded ``(codes, targets)`` chunks of a ``.xlsx`` or ``.csv`` file."""
+    import pandas as pd
+
+    # keep_default_na=False keeps the "None" severity level a string instead of NaN
+    if source.suffix.lower() == ".csv":
+        for frame in pd.read_csv(source, chunksize=CSV_CHUNK_ROWS, dtype=str, keep_default_na=False):
+            frame[config.target_names] = frame[config.target_names].astype(np.float64)
+            yield _encode_frame(config, frame)
+    else:
+        yield _encode_frame(config, pd.read_excel(source, keep_default_na=False))
+
+
+def _stamp(source):
+    stat = os.stat(source)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def build_cache(config, source, cache_dir):
+    """Convert ``source`` into ``cache_dir``, replacing any previous cache."""
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    stamp = _stamp(source)
+    chunks = list(_read_source(config, source))
+    codes = np.concatenate([c for c, _ in chunks]) if chunks else np.empty((0, len(config.features)), np.int8)
+    targets = np.concatenate([t for _, t in chunks]) if chunks else np.empty((0, len(config.target_names)))
+    for name, array in (("codes", codes), ("targets", targets)):
+        tmp_path = cache_dir / f"{name}.npy.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp_path, cache_dir / f"{name}.npy")
+    meta = {
+        "therapy": config.name,
+        "feature_names": config.features,
+        "categories": {f: list(c) for f, c in zip(config.features, config.categories)},
+        "target_names": config.target_names,
+        "rows": len(codes),
+        "source": source.name,
+        "source_sha256": file_sha256(source),
+        **stamp,
+    }
+    # meta.json goes last: a cache without it is treated as missing
+    tmp_path = cache_dir / "meta.json.tmp"
+    tmp_path.write_text(json.dumps(meta, indent=2))
+    os.replace(tmp_path, cache_dir / "meta.json")
+    return meta
+
+
+def _cache_is_fresh(config, source, cache_dir):
+    meta_path = cache_dir / "meta.json"
+    if not meta_path.exists():
+        return False
+    meta = json.loads(meta_path.read_text())
+    if meta["feature_names"] != config.features or meta["target_names"] != config.target_names:
+        return False
+    if list(meta["categories"].values()) != [list(c) for c in config.categories]:
+        return False
+    stamp = _stamp(source)
+    if meta["size"] == stamp["size"] and meta["mtime_ns"] == stamp["mtime_ns"]:
+        return True
+    if meta["source_sha256"] != file_sha256(source):
+        return False
+    # Touched but unchanged: remember the new mtime so the next check is cheap again
+    meta.update(stamp)
+    tmp_path = cache_dir / "meta.json.tmp"
+    tmp_path.write_text(json.dumps(meta, indent=2))
+    os.replace(tmp_path, meta_path)
+    return True
+
+
+def load_dataset(therapy, source=None, cache_dir=CACHE_DIR, mmap_mode="r"):
+    """Memory-map a therapy's dataset, (re)building its cache first if the source changed."""
+    config = THERAPY_CONFIGS[therapy]
+    source = Path(source) if source is not None else base_dir / config.source
+    directory = Path(cache_dir) / source.stem
+    if not _cache_is_fresh(config, source, directory):
+        start = time.perf_counter()
+        meta = build_cache(config, source, directory)
+        print(f"Cached {meta['rows']} rows of {source.name} in {time.perf_counter() - start:.2f}s")
+    codes = np.load(directory / "codes.npy", mmap_mode=mmap_mode)
+    targets = np.load(directory / "targets.npy", mmap_mode=mmap_mode)
+    return Dataset(config, codes, targets, source=source)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or refresh the columnar dataset caches")
+    parser.add_argument("therapies", nargs="*", help=f"any of {', '.join(THERAPY_CONFIGS)} (default: all)")
+    parser.add_argument("--source", help="convert this file instead of the therapy's default source")
+    args = parser.parse_args()
+    unknown = [t for t in args.therapies if t not in THERAPY_CONFIGS]
+    if unknown:
+        parser.error(f"unknown therapies: {', '.join(unknown)}")
+    for name in args.therapies or THERAPY_CONFIGS:
+        start = time.perf_counter()
+        dataset = load_dataset(name, source=args.source)
+        print(f"{name}: {len(dataset)} rows from {dataset.source.name} loaded in {(time.perf_counter() - start) * 1e3:.1f} ms")
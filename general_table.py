@@ -0,0 +1,118 @@
+"""Precomputed response table for the General model.
+
+The General model only sees ordinal features with a handful of levels each,
+so its whole input space can be scored once offline. ``build`` writes one
+prediction per mixed-radix index to ``General_table.npy`` (with a JSON
+sidecar describing the feature order), and ``load_general_table`` memory-maps
+it so every worker process shares a single page-cached copy.
+
+Build it with::
+
+    python general_table.py [--dtype float16]
+"""
+import argparse
+import json
+import os
+import pickle
+import time
+from pathlib import Path
+
+import numpy as np
+
+from compiled_model import encode_columns, file_sha256
+
+base_dir = Path(__file__).resolve().parent
+MODEL_PATH = base_dir / "General_model.pkl"
+TABLE_PATH = base_dir / "General_table.npy"
+META_PATH = base_dir / "General_table.json"
+
+
+def _strides(radices):
+    strides = np.ones(len(radices), dtype=np.int64)
+    for j in range(len(radices) - 2, -1, -1):
+        strides[j] = strides[j + 1] * radices[j + 1]
+    return strides
+
+
+class GeneralTable:
+    """Lookup-table stand-in for the compiled General model (same ``predict`` contract)."""
+
+    def __init__(self, table, feature_names, categories):
+        self.table = table
+        self.feature_names = list(feature_names)
+        self.categories = {name: list(cats) for name, cats in zip(self.feature_names, categories)}
+        self.code_maps = [{cat: float(i) for i, cat in enumerate(cats)} for cats in categories]
+        self.strides = _strides([len(c) for c in categories])
+        self.n_outputs = table.shape[1]
+
+    def encode(self, data):
+        return encode_columns(data, self.feature_names, self.code_maps)
+
+    def predict_codes(self, X):
+        X = np.asarray(X)
+        if X.ndim == 1:
+            X = X[None, :]
+        index = X.astype(np.int64) @ self.strides
+        return np.asarray(self.table[index], dtype=np.float32)
+
+    def predict(self, data):
+        return self.predict_codes(self.encode(data))
+
+
+def load_general_table(table_path=TABLE_PATH, meta_path=META_PATH, model_path=MODEL_PATH):
+    """Memory-map the table, or return None if it is missing or built from another model."""
+    if not (os.path.exists(table_path) and os.path.exists(meta_path)):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if os.path.exists(model_path) and meta.get("model_sha256") != file_sha256(model_path):
+        print(f"Ignoring stale {Path(table_path).name}: {Path(model_path).name} has changed")
+        return None
+    table = np.load(table_path, mmap_mode="r")
+    return GeneralTable(table, meta["feature_names"], meta["categories"])
+
+
+def build(model_path=MODEL_PATH, table_path=TABLE_PATH, meta_path=META_PATH,
+          dtype="float32", chunk_size=1 << 20):
+    """Score every input combination with the pickled model and write the table atomically."""
+    with open(model_path, "rb") as f:
+        pipeline = pickle.load(f)
+    preprocessor, regressor = pipeline.steps[0][1], pipeline.steps[-1][1]
+    _, encoder, feature_names = preprocessor.transformers_[0]
+    categories = [list(c) for c in encoder.categories_]
+    radices = np.array([len(c) for c in categories], dtype=np.int64)
+    strides = _strides(radices)
+    boosters = [e.get_booster() for e in getattr(regressor, "estimators_", [regressor])]
+    n_rows = int(np.prod(radices))
+
+    tmp_path = Path(str(table_path) + ".tmp")
+    table = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=dtype, shape=(n_rows, len(boosters)))
+    start_time = time.perf_counter()
+    for start in range(0, n_rows, chunk_size):
+        index = np.arange(start, min(start + chunk_size, n_rows), dtype=np.int64)
+        codes = ((index[:, None] // strides) % radices).astype(np.float32)
+        for k, booster in enumerate(boosters):
+            table[start:start + len(index), k] = booster.inplace_predict(codes)
+    table.flush()
+    del table
+    os.replace(tmp_path, table_path)
+
+    meta = {
+        "feature_names": list(feature_names),
+        "categories": categories,
+        "dtype": dtype,
+        "rows": n_rows,
+        "model_sha256": file_sha256(model_path),
+    }
+    with open(str(meta_path) + ".tmp", "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(str(meta_path) + ".tmp", meta_path)
+    print(f"Wrote {n_rows} rows to {Path(table_path).name} in {time.perf_counter() - start_time:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute the General model response table")
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    parser.add_argument("--chunk-size", type=int, default=1 << 20)
+    args = parser.parse_args()
+    build(dtype=args.dtype, chunk_size=args.chunk_size)
@@ -0,0 +1,48 @@
+# Production server: gunicorn -c gunicorn.conf.py app:app
+#
+# The app is imported and every model loaded and warmed in the master before
+# workers fork, so the NumPy model arrays are shared copy-on-write (and the
+# General table is a shared mmap) instead of being loaded once per worker.
+import gc
+import os
+
+# Same host/port rules as `python app.py`: 0.0.0.0 when the platform sets PORT
+port = int(os.environ.get("PORT", 8000))
+host = "0.0.0.0" if "PORT" in os.environ else "127.0.0.1"
+bind = f"{host}:{port}"
+
+
+def _available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+# A POST and the GET of its result page may land on different workers, so share results
+# through a file in the app directory (not the world-writable temp directory)
+base_dir = os.path.dirname(os.path.abspath(__file__))
+os.environ.setdefault("RESULT_STORE", f"sqlite:///{os.path.join(base_dir, 'results.db')}")
+
+workers = int(os.environ.get("WEB_CONCURRENCY", _available_cores()))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+
+# Recycle workers gracefully to bound memory growth; jitter avoids restarting all at once
+max_requests = int(os.environ.get("MAX_REQUESTS", 10000))
+max_requests_jitter = int(os.environ.get("MAX_REQUESTS_JITTER", 1000))
+graceful_timeout = 30
+timeout = 60
+keepalive = 5
+
+
+def when_ready(server):
+    from app import model_manager
+
+    if model_manager.load_all():
+        server.log.info("Loaded and warmed %d models in the master", len(model_manager.models))
+    else:
+        server.log.warning("Model loading failed in the master: %s", model_manager.errors)
+    # Move everything loaded so far out of the GC's reach so collections in the
+    # workers don't touch (and copy) the shared pages
+    gc.freeze()
@@ -0,0 +1,61 @@
+"""Bounded thread pool for CPU-bound inference.
+
+Inference gets its own small pool instead of sharing Starlette's default
+threadpool with template rendering and other sync handlers. The pool admits
+at most ``max_pending`` calls (running plus queued); beyond that ``run``
+raises ``Overloaded`` immediately so the request can be answered with a fast
+503 rather than waiting in an unbounded queue.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Overloaded(Exception):
+    """Raised when inference capacity is exhausted; carries the suggested retry delay."""
+
+    def __init__(self, message="Inference capacity exhausted", retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class InferencePool:
+    def __init__(self, max_workers=2, max_pending=256, retry_after=1):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _release(self, _future=None):
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+
+    async def run(self, fn, *args):
+        """Run ``fn(*args)`` on the pool, or raise ``Overloaded`` if it is saturated."""
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise Overloaded(retry_after=self.retry_after)
+            self.pending += 1
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "pending": self.pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
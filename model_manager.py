@@ -0,0 +1,355 @@
+"""Concurrent, warm-before-ready loading and hot reloading of the serving models.
+
+``ModelManager`` resolves each model to the cheapest artifact available: the
+General response table, then a compiled ``<Name>_model.npz`` (NumPy only, no
+sklearn/xgboost/pandas import), then the pickled pipeline compiled on the
+fly. Models load concurrently via ``load_all`` or lazily on the first
+``get``; each one runs warmup predictions before it is published, so
+``ready()`` only turns true once every model can serve at full speed.
+
+Every published model is a ``ModelVersion`` named by the SHA-256 prefix of
+the artifact it came from. ``reload`` loads, warms and checks a candidate in
+the calling (background) thread, then swaps it in with one dict assignment;
+requests holding the old version through ``use`` finish on it, and it is
+dropped once its reference count reaches zero. ``start_watching`` polls the
+artifacts' sizes and mtimes, plus a shared reload-request file that
+``request_reload`` touches, so a reload asked of one worker process reaches
+every worker on its next poll.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+from compiled_model import file_sha256, load_artifact, load_compiled, read_rejection
+from general_table import META_PATH, TABLE_PATH, load_general_table
+
+
+class ModelVersion:
+    """One loaded model and the requests currently using it."""
+
+    def __init__(self, name, model, version, artifact, load_seconds, warmup_seconds, fallback=None):
+        self.name = name
+        self.model = model
+        self.version = version
+        self.artifact = artifact
+        self.load_seconds = load_seconds
+        self.warmup_seconds = warmup_seconds
+        # Why the compiled .npz was not used, when the model came from its pickle
+        self.fallback = fallback
+        self.loaded_at = time.time()
+        self.refs = 0
+        self.retired_at = None
+
+    def describe(self):
+        return {
+            "version": self.version, "artifact": self.artifact, "loaded_at": self.loaded_at,
+            "in_use": self.refs, "retired_at": self.retired_at, "fallback": self.fallback,
+        }
+
+
+class ModelCheckError(Exception):
+    """A reload candidate failed its golden-input checks and was not published."""
+
+
+class ModelManager:
+    def __init__(self, base_dir, model_files, warmup_rows=64, max_workers=None, golden_rows=256):
+        self.base_dir = Path(base_dir)
+        self.model_files = dict(model_files)
+        self.warmup_rows = warmup_rows
+        self.golden_rows = golden_rows
+        self.max_workers = max_workers or len(self.model_files)
+        self.models = {}
+        self.versions = {}
+        self.retired = []
+        self.reloads = []
+        self.errors = {}
+        self.fallbacks = {}
+        self.load_seconds = {}
+        self.warmup_seconds = {}
+        self.cold_start_seconds = None
+        self.first_request_seconds = None
+        self._locks = {name: threading.Lock() for name in self.model_files}
+        self._refs_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._started = time.perf_counter()
+        self._ready_hooks = []
+        self._swap_hooks = []
+        self._validators = []
+        self._stamps = {}
+        self._watcher = None
+        self.reload_request_path = self.base_dir / ".model_reload"
+        self._seen_request = None
+
+    def on_ready(self, hook):
+        """Run ``hook()`` after every model has loaded, before reporting ready."""
+        self._ready_hooks.append(hook)
+
+    def on_swap(self, hook):
+        """Run ``hook(name)`` after a reloaded model has been published."""
+        self._swap_hooks.append(hook)
+
+    def add_validator(self, validator):
+        """``validator(name, model)`` raises to reject a reload candidate (e.g. a schema mismatch)."""
+        self._validators.append(validator)
+
+    def _artifact_paths(self, name):
+        stem = self.model_files[name]
+        paths = [self.base_dir / f"{stem}_model.pkl", self.base_dir / f"{stem}_model.npz"]
+        if name == "general":
+            paths += [Path(TABLE_PATH), Path(META_PATH)]
+        return paths
+
+    def _load(self, name):
+        """Load a model from its cheapest artifact; returns ``(model, artifact_path, fallback_reason)``."""
+        stem = self.model_files[name]
+        if name == "general":
+            table = load_general_table()
+            if table is not None:
+                return table, Path(META_PATH), None
+        pkl_path = self.base_dir / f"{stem}_model.pkl"
+        npz_path = self.base_dir / f"{stem}_model.npz"
+        model = load_artifact(npz_path, source_path=pkl_path)
+        if model is not None:
+            return model, npz_path, None
+        return load_compiled(pkl_path), pkl_path, self._fallback_reason(npz_path, pkl_path)
+
+    def _fallback_reason(self, npz_path, pkl_path):
+        """Why ``npz_path`` could not be used, so a regressed export is visible in stats and logs."""
+        if npz_path.exists():
+            # load_artifact has already logged this one
+            return f"{npz_path.name} is stale: {pkl_path.name} has changed"
+        rejection = read_rejection(npz_path, pkl_path)
+        if rejection is not None:
+            reason = f"{npz_path.name} was rejected by compiled_model.py: {rejection['reason']}"
+        else:
+            reason = f"{npz_path.name} is missing"
+        print(f"Compiling {pkl_path.name} at load time ({reason})")
+        return reason
+
+    def _stamp(self, name):
+        stamp = []
+        for path in self._artifact_paths(name):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                stamp.append(None)
+            else:
+                stamp.append((stat.st_size, stat.st_mtime_ns))
+        return tuple(stamp)
+
+    def warmup(self, model):
+        # Random valid codes exercise every tree path shape and the batch code path
+        rng = np.random.default_rng(0)
+        radices = [len(model.categories[f]) for f in model.feature_names]
+        X = (rng.random((self.warmup_rows, len(radices))) * radices).astype(np.float32)
+        model.predict_codes(X[:1])
+        model.predict_codes(X)
+
+    def _build(self, name):
+        stamp = self._stamp(name)
+        start = time.perf_counter()
+        model, artifact, fallback = self._load(name)
+        load_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        self.warmup(model)
+        warmup_seconds = time.perf_counter() - start
+        version = file_sha256(artifact)[:12]
+        return ModelVersion(name, model, version, artifact.name, load_seconds, warmup_seconds, fallback), stamp
+
+    def _publish(self, entry, stamp):
+        name = entry.name
+        old = self.versions.get(name)
+        self.versions[name] = entry
+        # A single dict assignment: readers see the old model or the new one, never a mix
+        self.models[name] = entry.model
+        self._stamps[name] = stamp
+        self.load_seconds[name] = entry.load_seconds
+        self.warmup_seconds[name] = entry.warmup_seconds
+        self.errors.pop(name, None)
+        if entry.fallback is None:
+            self.fallbacks.pop(name, None)
+        else:
+            self.fallbacks[name] = entry.fallback
+        if old is not None:
+            with self._refs_lock:
+                old.retired_at = time.time()
+                if old.refs:
+                    self.retired.append(old)
+
+    def get(self, name):
+        """Return a loaded, warmed model, loading it now if needed."""
+        model = self.models.get(name)
+        if model is not None:
+            return model
+        with self._locks[name]:
+            if name not in self.models:
+                try:
+                    entry, stamp = self._build(name)
+                except Exception as e:
+                    self.errors[name] = f"{type(e).__name__}: {e}"
+                    print(f"Error loading {name} model: {e}")
+                    raise
+                self._publish(entry, stamp)
+        return self.models[name]
+
+    def version(self, name):
+        """Version of the model currently published under ``name`` (loading it if needed)."""
+        self.get(name)
+        return self.versions[name].version
+
+    @contextmanager
+    def use(self, name):
+        """Hold the current version of a model for the duration of a call, even across a reload."""
+        self.get(name)
+        with self._refs_lock:
+            entry = self.versions[name]
+            entry.refs += 1
+        try:
+            yield entry.model
+        finally:
+            with self._refs_lock:
+                entry.refs -= 1
+                if entry.retired_at is not None and entry.refs == 0 and entry in self.retired:
+                    # Last in-flight call on a replaced version: let it go
+                    self.retired.remove(entry)
+
+    def golden_inputs(self, model):
+        """Fixed, seeded code rows every reload candidate is checked on."""
+        rng = np.random.default_rng(1)
+        radices = [len(model.categories[f]) for f in model.feature_names]
+        return rng.integers(0, radices, size=(self.golden_rows, len(radices))).astype(np.float32)
+
+    def check(self, name, candidate):
+        """Reject a candidate whose golden predictions are malformed or that fails a validator.
+
+        Returns the largest absolute change from the current version on the
+        golden rows (None when the feature layout changed), for the reload log.
+        """
+        X = self.golden_inputs(candidate)
+        pred = np.asarray(candidate.predict_codes(X))
+        if pred.ndim != 2 or len(pred) != len(X):
+            raise ModelCheckError(f"{name}: golden predictions have shape {pred.shape}")
+        if not np.isfinite(pred).all():
+            raise ModelCheckError(f"{name}: golden predictions are not all finite")
+        current = self.versions.get(name)
+        if current is not None and pred.shape[1] != current.model.n_outputs:
+            raise ModelCheckError(f"{name}: {pred.shape[1]} outputs instead of {current.model.n_outputs}")
+        for validator in self._validators:
+            try:
+                validator(name, candidate)
+            except Exception as e:
+                raise ModelCheckError(f"{name}: {e}") from e
+        if current is None or current.model.feature_names != candidate.feature_names:
+            return None
+        return float(np.abs(pred - current.model.predict_codes(X)).max())
+
+    def reload(self, name):
+        """Load, warm and check a new version of ``name`` and publish it; returns the reload record."""
+        start = time.perf_counter()
+        old = self.versions.get(name)
+        record = {"model": name, "from": old.version if old else None, "at": time.time()}
+        try:
+            entry, stamp = self._build(name)
+            if old is not None and entry.version == old.version:
+                self._stamps[name] = stamp
+                record.update(status="unchanged", to=old.version)
+            else:
+                record["golden_max_change"] = self.check(name, entry.model)
+                with self._locks[name]:
+                    self._publish(entry, stamp)
+                for hook in self._swap_hooks:
+                    hook(name)
+                record.update(status="swapped", to=entry.version)
+        except Exception as e:
+            # The current version keeps serving; the same files are not retried until they change
+            self._stamps[name] = self._stamp(name)
+            record.update(status="failed", error=f"{type(e).__name__}: {e}")
+            print(f"Reload of {name} failed: {e}")
+        record["seconds"] = time.perf_counter() - start
+        self.reloads = (self.reloads + [record])[-50:]
+        return record
+
+    def reload_changed(self, force=False):
+        """Reload every model whose artifacts changed since they were loaded (all of them with ``force``)."""
+        return [
+            self.reload(name) for name in self.model_files
+            if name in self.versions and (force or self._stamp(name) != self._stamps.get(name))
+        ]
+
+    def request_reload(self):
+        """Reload here now and ask every other worker process to reload on its next poll."""
+        self.reload_request_path.write_text(str(time.time()))
+        # This process reloads right here, so its own watcher need not repeat it
+        self._seen_request = self._reload_request_stamp()
+        return self.reload_changed(force=True)
+
+    def _reload_request_stamp(self):
+        try:
+            return os.stat(self.reload_request_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def start_watching(self, interval=5.0):
+        """Poll the artifacts every ``interval`` seconds in a daemon thread (one per process)."""
+        if self._watcher is not None or interval <= 0:
+            return
+
+        def watch():
+            self._seen_request = self._reload_request_stamp()
+            while True:
+                time.sleep(interval)
+                request = self._reload_request_stamp()
+                force, self._seen_request = request != self._seen_request, request
+                if self.ready() or self.models:
+                    self.reload_changed(force=force)
+
+        self._watcher = threading.Thread(target=watch, name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def _try_get(self, name):
+        try:
+            self.get(name)
+        except Exception:
+            pass
+
+    def load_all(self):
+        """Load and warm every model concurrently; failures are recorded per model."""
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            list(pool.map(self._try_get, self.model_files))
+        if self.errors:
+            return False
+        for hook in self._ready_hooks:
+            hook()
+        self.cold_start_seconds = time.perf_counter() - self._started
+        self._ready.set()
+        return True
+
+    def start_background(self):
+        threading.Thread(target=self.load_all, name="model-loader", daemon=True).start()
+
+    def ready(self):
+        return self._ready.is_set()
+
+    def record_first_request(self, seconds):
+        if self.first_request_seconds is None:
+            self.first_request_seconds = seconds
+
+    def stats(self):
+        return {
+            "ready": self.ready(),
+            "loaded": sorted(self.models),
+            "errors": dict(self.errors),
+            "fallbacks": dict(self.fallbacks),
+            "cold_start_seconds": self.cold_start_seconds,
+            "first_request_seconds": self.first_request_seconds,
+            "load_seconds": dict(self.load_seconds),
+            "warmup_seconds": dict(self.warmup_seconds),
+            "versions": {name: entry.describe() for name, entry in self.versions.items()},
+            "retired_in_use": [{"model": e.name, **e.describe()} for e in self.retired],
+            "reloads": list(self.reloads),
+        }
@@ -0,0 +1,20 @@
+"""Caps on the native BLAS/OpenMP thread pools of NumPy and XGBoost.
+
+The app, the training CLI and the scoring CLI get their parallelism from
+their own pools, so each process limits the native libraries' threads. The
+variables are only read when those libraries load, so call this before
+importing NumPy or XGBoost in the process it should affect (this module
+imports neither).
+"""
+import os
+
+NATIVE_THREAD_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+
+
+def limit_native_threads(threads, override=True):
+    """Set every native thread-count variable to ``threads`` (only where unset, without ``override``)."""
+    for var in NATIVE_THREAD_VARS:
+        if override:
+            os.environ[var] = str(threads)
+        else:
+            os.environ.setdefault(var, str(threads))
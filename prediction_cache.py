@@ -0,0 +1,60 @@
+"""Bounded, thread-safe LRU cache for model predictions.
+
+Intake answers repeat a lot, so ``app.py`` keys predictions by model name plus
+the packed ordinal codes of the row and reuses them across requests. The
+General model gets its own entries, which makes its result shared by every
+therapy that sees the same general answers.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def cache_key(name, codes):
+    """Key for one encoded row: the model name plus its codes packed as int8 bytes."""
+    return name, np.asarray(codes, dtype=np.int8).tobytes()
+
+
+class PredictionCache:
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,183 @@
+"""On-demand profiling of individual requests.
+
+``ProfilingMiddleware`` profiles a request when it carries ``X-Profile: <token>``
+matching the configured token, or at random for a ``sample_rate`` fraction of
+requests. A profiled request runs under ``cProfile`` (deterministic, event
+loop thread: routing, parsing, encoding, rendering) while a ``StackSampler``
+thread samples the event loop and the inference pool threads, so time spent
+in pool workers shows up in the collapsed stacks too. Only one request is
+profiled at a time per process; others pass through untouched.
+
+``ProfileStore`` keeps the newest ``keep`` profiles in a directory, each as
+``<id>.pstats`` (load with ``pstats.Stats``), ``<id>.collapsed`` (feed to
+``flamegraph.pl`` or speedscope) and ``<id>.json`` metadata with the
+therapy, status and latency.
+"""
+import asyncio
+import cProfile
+import hmac
+import json
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+
+class StackSampler(threading.Thread):
+    """Background thread counting the call stacks of selected threads every ``interval`` seconds."""
+
+    def __init__(self, thread_ids=(), name_prefixes=(), interval=0.001):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.thread_ids = set(thread_ids)
+        self.name_prefixes = tuple(name_prefixes)
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def _selected(self, names):
+        for ident, frame in sys._current_frames().items():
+            name = names.get(ident, str(ident))
+            if ident in self.thread_ids or (self.name_prefixes and name.startswith(self.name_prefixes)):
+                yield name, frame
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_name, frame in self._selected(names):
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(thread_name)
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def collapsed(self):
+        """Stacks in the collapsed ``frame;frame;frame count`` format used by flame graph tools."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class ProfileStore:
+    def __init__(self, directory, keep=50):
+        self.directory = Path(directory)
+        self.keep = keep
+        self._lock = threading.Lock()
+
+    def save(self, profiler, sampler, meta):
+        """Write one request's profile and metadata, then drop the oldest beyond ``keep``."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Millisecond timestamp first, so names sort oldest to newest
+        pid = f"{int(time.time() * 1000)}-{secrets.token_hex(4)}"
+        profiler.dump_stats(self.directory / f"{pid}.pstats")
+        (self.directory / f"{pid}.collapsed").write_text(sampler.collapsed())
+        meta = {"id": pid, **meta, "samples": sampler.samples}
+        tmp_path = self.directory / f"{pid}.json.tmp"
+        tmp_path.write_text(json.dumps(meta))
+        os.replace(tmp_path, self.directory / f"{pid}.json")
+        self.rotate()
+        return meta
+
+    def rotate(self):
+        with self._lock:
+            for meta_path in sorted(self.directory.glob("*.json"))[:-self.keep or None]:
+                for suffix in (".pstats", ".collapsed", ".json"):
+                    try:
+                        os.remove(meta_path.with_suffix(suffix))
+                    except FileNotFoundError:
+                        pass
+
+    def list(self, limit=50):
+        """Metadata of the newest profiles, newest first."""
+        profiles = []
+        for meta_path in sorted(self.directory.glob("*.json"), reverse=True)[:limit]:
+            try:
+                profiles.append(json.loads(meta_path.read_text()))
+            except (OSError, ValueError):
+                continue
+        return profiles
+
+    def path(self, pid, kind):
+        """Path of a stored ``pstats`` or ``collapsed`` file, or None."""
+        if kind not in ("pstats", "collapsed") or not all(c.isalnum() or c == "-" for c in pid):
+            return None
+        path = self.directory / f"{pid}.{kind}"
+        return path if path.exists() else None
+
+
+class ProfilingMiddleware:
+    def __init__(self, app, store, token=None, sample_rate=0.0, header="x-profile",
+                 sample_interval=0.001, thread_prefixes=("inference",), tag=None):
+        self.app = app
+        self.store = store
+        self.token = token
+        self.sample_rate = sample_rate
+        self.header = header.lower().encode("latin-1")
+        self.sample_interval = sample_interval
+        self.thread_prefixes = tuple(thread_prefixes)
+        self.tag = tag
+        self._busy = threading.Lock()
+
+    def _trigger(self, scope):
+        if self.token:
+            for name, value in scope["headers"]:
+                if name == self.header and hmac.compare_digest(value, self.token.encode("latin-1")):
+                    return "header"
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sample"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        trigger = self._trigger(scope) if scope["type"] == "http" else None
+        if trigger is None or not self._busy.acquire(blocking=False):
+            return await self.app(scope, receive, send)
+        try:
+            await self._profile(scope, receive, send, trigger)
+        finally:
+            self._busy.release()
+
+    async def _profile(self, scope, receive, send, trigger):
+        status = 500
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active in this thread
+            return await self.app(scope, receive, send)
+        sampler = StackSampler({threading.get_ident()}, self.thread_prefixes, self.sample_interval)
+        sampler.start()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            seconds = time.perf_counter() - start
+            profiler.disable()
+            sampler.stop()
+            meta = {
+                "created": time.time(),
+                "method": scope["method"],
+                "path": scope["path"],
+                "therapy": self.tag(scope) if self.tag else None,
+                "status": status,
+                "seconds": seconds,
+                "trigger": trigger,
+            }
+            try:
+                await asyncio.to_thread(self.store.save, profiler, sampler, meta)
+            except OSError as e:
+                print(f"Could not save profile of {scope['path']}: {e}")
@@ -0,0 +1,88 @@
+"""Running per-patient, per-therapy progress aggregates.
+
+A ``ProgressAggregate`` summarizes every session of one patient under one
+therapy in constant space: for each model output a count, running sum,
+EWMA, min/max with their timestamps, and a ring buffer of the last ``window``
+values. ``update`` folds in one session in O(1) (O(window) for the ring), so
+``SessionHistory`` keeps the aggregates current as it writes sessions and a
+trend query reads a single row instead of scanning the history.
+"""
+import json
+
+METRICS = ("dosha_level", "overall_improvement", "general_improvement")
+# Which direction counts as the best session for each metric
+BETTER = {"dosha_level": "lower", "overall_improvement": "higher", "general_improvement": "higher"}
+
+
+class ProgressAggregate:
+    def __init__(self, state=None, window=20, alpha=0.3):
+        state = state or {}
+        self.window = state.get("window", window)
+        self.alpha = state.get("alpha", alpha)
+        self.count = state.get("count", 0)
+        self.first_ts = state.get("first_ts")
+        self.last_ts = state.get("last_ts")
+        self.metrics = state.get("metrics", {})
+
+    @classmethod
+    def from_json(cls, text, **kwargs):
+        return cls(json.loads(text) if text else None, **kwargs)
+
+    def to_json(self):
+        return json.dumps({
+            "window": self.window, "alpha": self.alpha, "count": self.count,
+            "first_ts": self.first_ts, "last_ts": self.last_ts, "metrics": self.metrics,
+        })
+
+    def update(self, ts, values):
+        """Fold in one session's ``{metric: value}`` outputs (``None`` values are skipped)."""
+        self.count += 1
+        self.first_ts = ts if self.first_ts is None else min(self.first_ts, ts)
+        self.last_ts = ts if self.last_ts is None else max(self.last_ts, ts)
+        for name in METRICS:
+            value = values.get(name)
+            if value is None:
+                continue
+            m = self.metrics.get(name)
+            if m is None:
+                self.metrics[name] = {
+                    "count": 1, "sum": value, "ewma": value, "last": value, "previous": None,
+                    "min": value, "min_ts": ts, "max": value, "max_ts": ts, "recent": [[ts, value]],
+                }
+                continue
+            m["count"] += 1
+            m["sum"] += value
+            m["ewma"] += self.alpha * (value - m["ewma"])
+            m["previous"], m["last"] = m["last"], value
+            if value < m["min"]:
+                m["min"], m["min_ts"] = value, ts
+            if value > m["max"]:
+                m["max"], m["max_ts"] = value, ts
+            m["recent"].append([ts, value])
+            del m["recent"][:-self.window]
+
+    def summary(self):
+        """Trend view: per metric mean, EWMA, moving average, deltas and best/worst session."""
+        metrics = {}
+        for name, m in self.metrics.items():
+            recent = [v for _, v in m["recent"]]
+            low, high = {"value": m["min"], "ts": m["min_ts"]}, {"value": m["max"], "ts": m["max_ts"]}
+            best, worst = (low, high) if BETTER[name] == "lower" else (high, low)
+            metrics[name] = {
+                "count": m["count"],
+                "mean": m["sum"] / m["count"],
+                "ewma": m["ewma"],
+                "moving_average": sum(recent) / len(recent),
+                "last": m["last"],
+                "delta": None if m["previous"] is None else m["last"] - m["previous"],
+                "change_since_first_in_window": recent[-1] - recent[0],
+                "best": best,
+                "worst": worst,
+                "recent": [{"ts": ts, "value": v} for ts, v in m["recent"]],
+                "recent_deltas": [b - a for a, b in zip(recent, recent[1:])],
+                "better": BETTER[name],
+            }
+        return {
+            "sessions": self.count, "first_ts": self.first_ts, "last_ts": self.last_ts,
+            "window": self.window, "ewma_alpha": self.alpha, "metrics": metrics,
+        }
@@ -0,0 +1,118 @@
+"""Bounded, content-addressed storage for rendered prediction results.
+
+Each result is stored under ``result_id(therapy, values)``, a hash of the
+therapy and the answers its model consumed, so identical submissions map to
+the same immutable result URL. ``MemoryResultStore`` keeps entries in the
+process with TTL + LRU eviction; ``SQLiteResultStore`` keeps them in a local
+SQLite file so every worker process sees the same results, as JSON so that
+whoever can write the file can at worst corrupt a result, not run code. It connects on
+first use in each process and thread, never at construction, so a store
+created in the gunicorn master before the fork is safe to use in the
+workers. ``blocking`` tells async callers whether ``put``/``get`` do I/O and
+belong on a worker thread.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from sqlite_local import LocalConnections
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS results ("
+    "id TEXT PRIMARY KEY, expires REAL NOT NULL, accessed REAL NOT NULL, value BLOB NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)",
+)
+
+
+def result_id(therapy, values):
+    """Stable ID for a therapy and the ordered answer values its model consumed."""
+    digest = hashlib.sha256("\x1f".join([therapy, *values]).encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+class MemoryResultStore:
+    blocking = False
+
+    def __init__(self, max_entries=10000, ttl=86400):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+
+class SQLiteResultStore:
+    """Result store shared by all worker processes through one SQLite file (WAL mode)."""
+
+    blocking = True
+
+    def __init__(self, path, max_entries=100000, ttl=86400, prune_every=500):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.prune_every = prune_every
+        self._connections = LocalConnections(path, SCHEMA)
+        self._connect = self._connections.connect
+        self._puts = 0
+
+    def put(self, key, value):
+        now = time.time()
+        db = self._connect()
+        db.execute(
+            "INSERT OR REPLACE INTO results (id, expires, accessed, value) VALUES (?, ?, ?, ?)",
+            (key, now + self.ttl, now, json.dumps(value)),
+        )
+        self._puts += 1
+        if self._puts % self.prune_every == 0:
+            self.prune()
+
+    def get(self, key):
+        now = time.time()
+        db = self._connect()
+        row = db.execute("SELECT expires, value FROM results WHERE id = ?", (key,)).fetchone()
+        if row is None or row[0] < now:
+            return None
+        try:
+            value = json.loads(row[1])
+        except ValueError:
+            # Not ours (or written by an older, pickling version): treat as missing
+            return None
+        db.execute("UPDATE results SET accessed = ? WHERE id = ?", (now, key))
+        return value
+
+    def prune(self):
+        """Drop expired rows, then the least recently accessed ones beyond ``max_entries``."""
+        db = self._connect()
+        db.execute("DELETE FROM results WHERE expires < ?", (time.time(),))
+        db.execute(
+            "DELETE FROM results WHERE id IN (SELECT id FROM results ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+
+def open_result_store(url, max_entries=10000, ttl=86400):
+    """``memory`` for a per-process store, ``sqlite:///path/to/results.db`` for a shared one."""
+    if url.startswith("sqlite:///"):
+        return SQLiteResultStore(url[len("sqlite:///"):], max_entries=max_entries, ttl=ttl)
+    if url == "memory":
+        return MemoryResultStore(max_entries=max_entries, ttl=ttl)
+    raise ValueError(f"Unsupported RESULT_STORE: {url!r}")
@@ -0,0 +1,319 @@
+"""Offline bulk scoring of digitized feedback spreadsheets.
+
+Scores every row of a ``.csv``, ``.parquet`` or ``.xlsx`` file with one
+therapy's model and the General model, using the same artifacts and feature
+lists as the web app::
+
+    python score.py basti backlog.csv --output scored.csv
+    python score.py vamana clinic.xlsx --output vamana.csv --keep Patient_ID --jobs 8
+
+The input is read in chunks of ``--chunk-rows`` rows (only the needed
+columns), each chunk is decoded and scored on a process pool, and results
+are appended to the output CSV strictly in input order, so memory stays
+bounded by the chunks in flight whatever the file size. Rows with missing or
+unknown answers are kept with empty predictions and an ``error`` message.
+
+After every written chunk the output is fsynced and ``<output>.checkpoint.json``
+records how many input rows and output bytes are done. Rerunning the same
+command after a crash truncates the output back to the checkpoint and
+resumes from the next row; ``--restart`` starts over instead.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import numpy as np
+
+from native_threads import limit_native_threads
+from therapies import feature_defaults, model_files, therapy_dosha, therapy_features
+
+base_dir = Path(__file__).resolve().parent
+OUTPUTS = ("dosha_level", "overall_improvement", "general_improvement")
+
+
+def _stamp(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _clean(values):
+    # Empty cells become "" so a column is all strings and np.unique can sort it
+    return np.array(["" if v is None or v != v else str(v) for v in values], dtype=object)
+
+
+def _read_csv(path, columns, chunk_rows, skip_rows):
+    import pandas as pd
+
+    # keep_default_na=False keeps the "None" severity level a string
+    reader = pd.read_csv(
+        path, dtype=str, keep_default_na=False, chunksize=chunk_rows,
+        usecols=lambda c: c in columns, skiprows=range(1, skip_rows + 1),
+    )
+    for frame in reader:
+        yield {c: frame[c].to_numpy(dtype=object) for c in frame.columns}, len(frame)
+
+
+def _read_parquet(path, columns, chunk_rows, skip_rows):
+    import pyarrow.parquet as pq
+
+    parquet = pq.ParquetFile(path)
+    names = [c for c in parquet.schema_arrow.names if c in columns]
+    # Skip whole row groups before the checkpoint without reading them
+    first, start = 0, 0
+    while first < parquet.num_row_groups and start + parquet.metadata.row_group(first).num_rows <= skip_rows:
+        start += parquet.metadata.row_group(first).num_rows
+        first += 1
+    skip = skip_rows - start
+    row_groups = list(range(first, parquet.num_row_groups))
+    for batch in parquet.iter_batches(batch_size=chunk_rows, row_groups=row_groups, columns=names):
+        if skip >= batch.num_rows:
+            skip -= batch.num_rows
+            continue
+        batch, skip = batch.slice(skip), 0
+        yield {c: _clean(batch.column(c).to_pylist()) for c in names}, batch.num_rows
+
+
+def _read_xlsx(path, columns, chunk_rows, skip_rows):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(c).strip() if c is not None else "" for c in next(rows, ())]
+        wanted = [(j, c) for j, c in enumerate(header) if c in columns]
+        for _ in zip(range(skip_rows), rows):
+            pass
+        buffer = []
+        for row in rows:
+            buffer.append(row)
+            if len(buffer) == chunk_rows:
+                yield {c: _clean(r[j] if j < len(r) else None for r in buffer) for j, c in wanted}, len(buffer)
+                buffer = []
+        if buffer:
+            yield {c: _clean(r[j] if j < len(r) else None for r in buffer) for j, c in wanted}, len(buffer)
+    finally:
+        workbook.close()
+
+
+READERS = {".csv": _read_csv, ".parquet": _read_parquet, ".xlsx": _read_xlsx}
+
+
+def count_rows(path):
+    """Data rows in ``path`` when cheaply known (Parquet metadata, xlsx dimensions), else None."""
+    suffix = path.suffix.lower()
+    if suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        return pq.ParquetFile(path).metadata.num_rows
+    if suffix == ".xlsx":
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True)
+        try:
+            max_row = workbook.active.max_row
+        finally:
+            workbook.close()
+        return max_row - 1 if max_row else None
+    return None
+
+
+# Per-process state of the pool workers
+_worker = None
+
+
+def _init_worker(therapy, threads):
+    limit_native_threads(threads)
+    from model_manager import ModelManager
+
+    global _worker
+    manager = ModelManager(base_dir, {therapy: model_files[therapy], "general": model_files["general"]})
+    model, general = manager.get(therapy), manager.get("general")
+    general_columns = np.array([model.feature_names.index(f) for f in general.feature_names], dtype=np.intp)
+    code_maps = [{c: i for i, c in enumerate(model.categories[f])} for f in model.feature_names]
+    _worker = model, general, general_columns, code_maps
+
+
+def score_chunk(index, columns, n_rows):
+    """Decode and score one chunk in a pool worker; returns ``(index, predictions, errors)``."""
+    model, general, general_columns, code_maps = _worker
+    codes = np.empty((n_rows, len(model.feature_names)), dtype=np.int8)
+    errors = [None] * n_rows
+    for j, (name, code_map) in enumerate(zip(model.feature_names, code_maps)):
+        default = code_map.get(feature_defaults.get(name), -1)
+        values = columns.get(name)
+        if values is None:
+            codes[:, j] = default
+        else:
+            # Look up each distinct answer once, then scatter
+            uniques, inverse = np.unique(values, return_inverse=True)
+            lut = np.array([code_map.get(u.strip(), -1) if u.strip() else default for u in uniques], dtype=np.int8)
+            codes[:, j] = lut[inverse]
+        for i in np.flatnonzero(codes[:, j] < 0):
+            if errors[i] is None:
+                value = None if values is None else values[i]
+                errors[i] = f"{name}: missing" if not value else f"{name}: unknown value {value!r}"
+    predictions = np.full((n_rows, len(OUTPUTS)), np.nan, dtype=np.float32)
+    valid = np.flatnonzero([e is None for e in errors])
+    if len(valid):
+        X = codes[valid]
+        therapy_pred = model.predict_codes(X)
+        n_outputs = min(2, therapy_pred.shape[1])
+        predictions[valid, :n_outputs] = therapy_pred[:, :n_outputs]
+        predictions[valid, 2] = general.predict_codes(X[:, general_columns])[:, 0]
+    return index, predictions, errors
+
+
+class Checkpoint:
+    """``<output>.checkpoint.json``: input rows and output bytes safely written so far."""
+
+    def __init__(self, output, therapy, input_path):
+        self.path = Path(f"{output}.checkpoint.json")
+        self.identity = {"therapy": therapy, "input": str(Path(input_path).resolve()), **_stamp(input_path)}
+
+    def load(self):
+        """``(rows, output_bytes)`` to resume from, or None; raises if the checkpoint is for another run."""
+        if not self.path.exists():
+            return None
+        state = json.loads(self.path.read_text())
+        mismatched = [k for k, v in self.identity.items() if state.get(k) != v]
+        if mismatched:
+            raise ValueError(f"{self.path.name} was written for a different run ({', '.join(mismatched)} changed); use --restart")
+        return state["rows"], state["output_bytes"]
+
+    def save(self, rows, output_bytes):
+        tmp_path = Path(f"{self.path}.tmp")
+        tmp_path.write_text(json.dumps({**self.identity, "rows": rows, "output_bytes": output_bytes}))
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _format_chunk(start, columns, n_rows, keep, predictions, errors):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    kept = [columns.get(c, [""] * n_rows) for c in keep]
+    for i in range(n_rows):
+        scores = ["" if np.isnan(v) else f"{v:.4f}" for v in predictions[i]]
+        writer.writerow([start + i, *(k[i] for k in kept), *scores, errors[i] or ""])
+    return buffer.getvalue().encode("utf-8")
+
+
+def score_file(therapy, input_path, output, chunk_rows=100_000, jobs=None, threads=1, keep=(),
+               restart=False, progress_seconds=5.0, log=sys.stderr):
+    """Score ``input_path`` into ``output``, resuming from its checkpoint; returns a summary dict."""
+    input_path, output = Path(input_path), Path(output)
+    reader = READERS.get(input_path.suffix.lower())
+    if reader is None:
+        raise ValueError(f"Unsupported input {input_path.name}: expected one of {', '.join(READERS)}")
+    checkpoint = Checkpoint(output, therapy, input_path)
+    if restart:
+        checkpoint.remove()
+    resume = checkpoint.load()
+    rows_done, output_bytes = resume or (0, 0)
+    header = ["row", *keep, f"{therapy_dosha[therapy]}_level", "overall_improvement", "general_improvement", "error"]
+
+    out = open(output, "r+b" if resume else "wb")
+    if resume:
+        # Drop anything written after the last checkpoint
+        out.truncate(output_bytes)
+        out.seek(output_bytes)
+        print(f"Resuming {input_path.name} at row {rows_done:,}", file=log)
+    else:
+        out.write((",".join(header) + "\n").encode("utf-8"))
+
+    columns_needed = set(therapy_features[therapy]) | set(keep)
+    chunks = reader(input_path, columns_needed, chunk_rows, rows_done)
+    total = count_rows(input_path)
+    jobs = jobs or max(1, (os.cpu_count() or 1) // threads)
+    started = last_report = time.perf_counter()
+    rows_at_start, invalid = rows_done, 0
+    next_index, submitted, exhausted = 0, 0, False
+    inputs, results, futures = {}, {}, set()
+
+    with out, ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(therapy, threads)) as pool:
+        while True:
+            # Keep at most two chunks per worker read but not yet written
+            while not exhausted and submitted - next_index < 2 * jobs:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    exhausted = True
+                    break
+                columns, n_rows = chunk
+                inputs[submitted] = chunk
+                futures.add(pool.submit(score_chunk, submitted, columns, n_rows))
+                submitted += 1
+            if not futures:
+                break
+            done, futures = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, predictions, errors = future.result()
+                results[index] = predictions, errors
+            # Write completed chunks in input order
+            while next_index in results:
+                predictions, errors = results.pop(next_index)
+                columns, n_rows = inputs.pop(next_index)
+                out.write(_format_chunk(rows_done, columns, n_rows, keep, predictions, errors))
+                out.flush()
+                os.fsync(out.fileno())
+                rows_done += n_rows
+                invalid += sum(e is not None for e in errors)
+                checkpoint.save(rows_done, out.tell())
+                next_index += 1
+            now = time.perf_counter()
+            if now - last_report >= progress_seconds:
+                last_report = now
+                rate = (rows_done - rows_at_start) / (now - started)
+                eta = f", ETA {(total - rows_done) / rate:.0f}s" if total and rate else ""
+                of_total = f"/{total:,}" if total else ""
+                print(f"{rows_done:,}{of_total} rows, {rate:,.0f} rows/s{eta}", file=log)
+
+    checkpoint.remove()
+    seconds = time.perf_counter() - started
+    scored = rows_done - rows_at_start
+    summary = {
+        "rows": rows_done,
+        "scored_this_run": scored,
+        "invalid_rows": invalid,
+        "seconds": seconds,
+        "rows_per_second": scored / seconds if seconds else 0.0,
+    }
+    print(f"Scored {scored:,} rows ({invalid:,} invalid) in {seconds:.1f}s, {summary['rows_per_second']:,.0f} rows/s -> {output}", file=log)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a spreadsheet of feedback rows offline")
+    parser.add_argument("therapy", choices=sorted(therapy_features))
+    parser.add_argument("input", help="a .csv, .parquet or .xlsx file with one answer column per feature")
+    parser.add_argument("--output", required=True, help="CSV file for the predictions")
+    parser.add_argument("--chunk-rows", type=int, default=100_000)
+    parser.add_argument("--jobs", type=int, default=None, help="pool processes (default: cores / threads)")
+    parser.add_argument("--threads", type=int, default=1, help="native threads per process")
+    parser.add_argument("--keep", action="append", default=[], metavar="COLUMN",
+                        help="copy this input column (e.g. a patient id) into the output; repeatable")
+    parser.add_argument("--restart", action="store_true", help="ignore any checkpoint and start over")
+    parser.add_argument("--progress-seconds", type=float, default=5.0)
+    args = parser.parse_args(argv)
+    if Path(args.input).suffix.lower() not in READERS:
+        parser.error(f"input must be one of {', '.join(READERS)}")
+    try:
+        score_file(
+            args.therapy, args.input, args.output, chunk_rows=args.chunk_rows, jobs=args.jobs,
+            threads=args.threads, keep=args.keep, restart=args.restart, progress_seconds=args.progress_seconds,
+        )
+    except ValueError as e:
+        parser.exit(1, f"{e}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""Persistent per-patient history of every prediction.
+
+``SessionHistory`` keeps one row per scored form submission for a patient
+(anonymous ones are not kept) in a SQLite file (WAL mode) indexed on
+``(patient, therapy, ts)``: the int8 answer codes the model consumed and its
+outputs. ``record`` only appends to an in-memory
+queue; a background writer thread drains it in batched transactions every
+``flush_interval`` seconds (or once ``batch_size`` rows are waiting), so the
+request path never touches the disk. When the queue is full new sessions are
+dropped and counted rather than blocking requests. Nothing is opened at
+construction: each process starts its own queue, writer thread and
+connections on first use (``start``), so a history created in the gunicorn
+master before the fork gets a live writer in every worker. The workers share
+the file; WAL lets them append while others read.
+
+The same transactions keep one ``ProgressAggregate`` row per (patient,
+therapy) in step with the sessions, so ``trend`` answers from that row alone.
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from progress import METRICS, ProgressAggregate
+from sqlite_local import LocalConnections
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS sessions ("
+    "id INTEGER PRIMARY KEY, patient TEXT, therapy TEXT NOT NULL, ts REAL NOT NULL, "
+    "codes BLOB NOT NULL, dosha_level REAL, overall_improvement REAL, general_improvement REAL, "
+    "result_id TEXT)",
+    "CREATE INDEX IF NOT EXISTS sessions_patient ON sessions (patient, therapy, ts)",
+    "CREATE TABLE IF NOT EXISTS aggregates ("
+    "patient TEXT NOT NULL, therapy TEXT NOT NULL, state TEXT NOT NULL, "
+    "PRIMARY KEY (patient, therapy)) WITHOUT ROWID",
+)
+COLUMNS = ("patient", "therapy", "ts", "codes", "dosha_level", "overall_improvement", "general_improvement", "result_id")
+
+
+def _float(value):
+    return None if value is None else float(value)
+
+
+class SessionHistory:
+    def __init__(self, path, batch_size=500, flush_interval=0.2, max_queue=100000, window=20, alpha=0.3):
+        self.path = path
+        self.window = window
+        self.alpha = alpha
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._connections = LocalConnections(path, SCHEMA, on_create=self._migrate)
+        self._connect = self._connections.connect
+        self._start_lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._stop = None
+        self._writer = None
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.last_flush_seconds = 0.0
+
+    def start(self):
+        """Start this process's queue and writer thread (idempotent; a forked child gets its own)."""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._start_lock:
+            if self._pid == pid:
+                return
+            # Whatever was inherited from the parent has no thread draining it here
+            self._queue = queue.Queue(maxsize=self.max_queue)
+            self._stop = threading.Event()
+            self.written = self.dropped = self.batches = 0
+            self.last_flush_seconds = 0.0
+            self._writer = threading.Thread(target=self._run, name="session-writer", daemon=True)
+            self._writer.start()
+            self._pid = pid
+
+    def _migrate(self, db):
+        # Histories recorded before aggregates existed get theirs built once
+        if db.execute("SELECT 1 FROM aggregates LIMIT 1").fetchone() is None and \
+                db.execute("SELECT 1 FROM sessions WHERE patient IS NOT NULL LIMIT 1").fetchone() is not None:
+            self.rebuild_aggregates()
+
+    def record(self, patient, therapy, codes, results, rid=None, ts=None):
+        """Queue one session for writing; never blocks (returns False if it was dropped or has no patient)."""
+        if patient is None:
+            # Nobody could ever ask for an anonymous session back, so it is not kept
+            return False
+        self.start()
+        row = (
+            patient, therapy, time.time() if ts is None else ts, np.asarray(codes, dtype=np.int8).tobytes(),
+            _float(results.get("dosha_level")), _float(results.get("overall_improvement")),
+            _float(results.get("general_improvement")), rid,
+        )
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def _drain(self, first):
+        rows = [first]
+        while len(rows) < self.batch_size:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _write(self, rows):
+        start = time.perf_counter()
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            db.executemany(f"INSERT INTO sessions ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", rows)
+            self._update_aggregates(db, rows)
+            db.execute("COMMIT")
+        except sqlite3.Error as e:
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            self.dropped += len(rows)
+            print(f"Could not write {len(rows)} sessions: {e}")
+            return
+        self.written += len(rows)
+        self.batches += 1
+        self.last_flush_seconds = time.perf_counter() - start
+
+    def _update_aggregates(self, db, rows):
+        grouped = {}
+        for patient, therapy, ts, _, *outputs, _ in rows:
+            if patient is not None:
+                grouped.setdefault((patient, therapy), []).append((ts, dict(zip(METRICS, outputs))))
+        for (patient, therapy), sessions in grouped.items():
+            row = db.execute("SELECT state FROM aggregates WHERE patient = ? AND therapy = ?", (patient, therapy)).fetchone()
+            aggregate = ProgressAggregate.from_json(row and row[0], window=self.window, alpha=self.alpha)
+            for ts, outputs in sessions:
+                aggregate.update(ts, outputs)
+            db.execute(
+                "INSERT OR REPLACE INTO aggregates (patient, therapy, state) VALUES (?, ?, ?)",
+                (patient, therapy, aggregate.to_json()),
+            )
+
+    def rebuild_aggregates(self):
+        """Recompute every aggregate from the stored sessions (one pass in index order)."""
+        db = self._connect()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("DELETE FROM aggregates")
+            key, aggregate = None, None
+            rows = db.execute(
+                f"SELECT patient, therapy, ts, {', '.join(METRICS)} FROM sessions "
+                "WHERE patient IS NOT NULL ORDER BY patient, therapy, ts"
+            )
+            for patient, therapy, ts, *outputs in rows:
+                if (patient, therapy) != key:
+                    if aggregate is not None:
+                        db.execute("INSERT INTO aggregates (patient, therapy, state) VALUES (?, ?, ?)", (*key, aggregate.to_json()))
+                    key, aggregate = (patient, therapy), ProgressAggregate(window=self.window, alpha=self.alpha)
+                aggregate.update(ts, dict(zip(METRICS, outputs)))
+            if aggregate is not None:
+                db.execute("INSERT INTO aggregates (patient, therapy, state) VALUES (?, ?, ?)", (*key, aggregate.to_json()))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def trend(self, patient, therapy=None):
+        """``{therapy: ProgressAggregate.summary()}`` for a patient, read from the aggregates only."""
+        query, params = "SELECT therapy, state FROM aggregates WHERE patient = ?", [patient]
+        if therapy is not None:
+            query += " AND therapy = ?"
+            params.append(therapy)
+        rows = self._connect().execute(query, params).fetchall()
+        return {therapy: ProgressAggregate.from_json(state).summary() for therapy, state in rows}
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            # Give a burst a moment to accumulate into one transaction
+            if self._queue.qsize() < self.batch_size and not self._stop.is_set():
+                time.sleep(self.flush_interval)
+            self._write(self._drain(first))
+
+    def close(self, timeout=5.0):
+        """Flush queued sessions and stop this process's writer, if it was started."""
+        if self._pid != os.getpid():
+            return
+        self._stop.set()
+        self._writer.join(timeout)
+
+    def sessions(self, patient, therapy=None, since=None, until=None, limit=1000):
+        """A patient's sessions, oldest first, optionally for one therapy and a ``[since, until)`` time range."""
+        clauses, params = ["patient = ?"], [patient]
+        if therapy is not None:
+            clauses.append("therapy = ?")
+            params.append(therapy)
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("ts < ?")
+            params.append(until)
+        rows = self._connect().execute(
+            f"SELECT therapy, ts, codes, dosha_level, overall_improvement, general_improvement, result_id "
+            f"FROM sessions WHERE {' AND '.join(clauses)} ORDER BY ts LIMIT ?",
+            (*params, limit),
+        ).fetchall()
+        return [
+            {
+                "therapy": therapy, "ts": ts, "codes": list(codes), "dosha_level": dosha,
+                "overall_improvement": overall, "general_improvement": general, "result_id": rid,
+            }
+            for therapy, ts, codes, dosha, overall, general, rid in rows
+        ]
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize() if self._pid == os.getpid() else 0,
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "last_flush_seconds": self.last_flush_seconds,
+        }
+
+
+def open_session_history(url):
+    """``sqlite:///path/to/sessions.db``, or ``off`` to keep no history (returns None)."""
+    if url == "off":
+        return None
+    if url.startswith("sqlite:///"):
+        return SessionHistory(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported SESSION_HISTORY: {url!r}")
@@ -0,0 +1,46 @@
+"""Per-thread, per-process SQLite connections for the stores shared by the workers.
+
+``LocalConnections`` opens nothing until ``connect`` is first called in a
+thread, so an object created in the gunicorn master before the fork is safe
+to use in every worker: a forked child inherits the parent's thread-local
+handle, and SQLite handles must not cross ``fork()``, so connections are
+keyed by pid as well as thread. The file is switched to WAL and the schema
+created once per process, followed by an optional ``on_create(db)`` hook for
+one-off migrations.
+"""
+import os
+import sqlite3
+import threading
+
+
+class LocalConnections:
+    def __init__(self, path, schema, on_create=None, timeout=5):
+        self.path = path
+        self.schema = tuple(schema)
+        self.on_create = on_create
+        self.timeout = timeout
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_pid = None
+
+    def connect(self):
+        """This thread's connection in this process, opening it (and the schema) on first use."""
+        pid = os.getpid()
+        if getattr(self._local, "pid", None) != pid:
+            db = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db, self._local.pid = db, pid
+            self._create_schema(db, pid)
+        return self._local.db
+
+    def _create_schema(self, db, pid):
+        with self._schema_lock:
+            if self._schema_pid == pid:
+                return
+            db.execute("PRAGMA journal_mode=WAL")
+            for statement in self.schema:
+                db.execute(statement)
+            if self.on_create is not None:
+                # The hook may call connect() again; this thread's handle is already set
+                self.on_create(db)
+            self._schema_pid = pid
@@ -0,0 +1,61 @@
+"""Pre-rendered, HTTP-cacheable pages.
+
+The therapy forms and the home page have no per-request content, so they are
+rendered once into bytes together with precompressed gzip (and, when the
+optional ``brotli`` package is installed, brotli) variants. Each variant has
+a strong ETag, which lets ``StaticPage.respond`` answer conditional GETs with
+304 and otherwise send the best encoding the client accepts without doing
+any template or compression work per request.
+"""
+import gzip
+import hashlib
+
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def accepted_encodings(header):
+    """Content codings the client accepts (those not explicitly given q=0)."""
+    accepted = set()
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        params = params.replace(" ", "")
+        if coding and params not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(coding.lower())
+    return accepted
+
+
+class StaticPage:
+    def __init__(self, body, media_type="text/html; charset=utf-8", max_age=3600):
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.media_type = media_type
+        self.cache_control = f"public, max-age={max_age}"
+        # encoding -> (body, etag); strong ETags must differ between encodings
+        self.variants = {"identity": (body, f'"{digest}"')}
+        self.variants["gzip"] = (gzip.compress(body, compresslevel=9, mtime=0), f'"{digest}-gz"')
+        if brotli is not None:
+            self.variants["br"] = (brotli.compress(body, quality=11), f'"{digest}-br"')
+
+    def respond(self, request):
+        accepted = accepted_encodings(request.headers.get("accept-encoding", ""))
+        encoding = next((e for e in ("br", "gzip") if e in self.variants and e in accepted), "identity")
+        body, etag = self.variants[encoding]
+        headers = {"ETag": etag, "Cache-Control": self.cache_control, "Vary": "Accept-Encoding"}
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type=self.media_type, headers=headers)
+
+
+def render_pages(env, names, max_age=3600, **context):
+    """Render each template once into a ``StaticPage`` cached for ``max_age`` seconds."""
+    return {
+        name: StaticPage(env.get_template(name).render(**context).encode("utf-8"), max_age=max_age)
+        for name in names
+    }
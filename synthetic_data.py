@@ -0,0 +1,221 @@
+"""Vectorized synthetic feedback data, as generated by the training notebooks.
+
+Each notebook draws every answer uniformly from its categories and scores
+targets with ``score_map``, where a category's score is its position in the
+``order_map`` order plus one. A target is the mean of some scores (some
+inverted as ``6 - score``) as a 0-100 percentage, rounded to one decimal.
+``THERAPY_CONFIGS`` restates those formulas as signed feature lists, so here
+a whole chunk of rows is scored with one integer matrix product over the
+ordinal codes instead of a row-wise ``df.apply``.
+
+Rows are produced in fixed-size chunks, chunk ``i`` drawn from its own
+generator seeded with ``(seed, i)``, so memory stays bounded, chunks can be
+generated independently, and a corpus is reproducible from its seed and
+chunk size. Write a corpus with::
+
+    python synthetic_data.py basti --rows 10000000 --format npy --output data/
+"""
+import argparse
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+from therapy_schema import ORDER_MAP
+
+GENERAL_FEATURES = [
+    "Energy_Level", "Mood", "Appetite", "Sleep_Quality", "Digestion",
+    "Stress_Level", "Concentration", "Physical_Activity", "Hydration", "Mood_Swings"
+]
+# Inputs of the Overall_Improvement score in most therapy notebooks
+IMPROVEMENT = ["Energy_Level", "Appetite", "Digestion", "Sleep_Quality", "Hydration", "Concentration"]
+
+
+class TherapyConfig:
+    """Feature order and target formulas of one notebook's dataset.
+
+    ``targets`` maps a target column to its terms: a feature name adds its
+    score, ``"-Name"`` adds ``6 - score``.
+    """
+
+    def __init__(self, name, features, targets, source):
+        self.name = name
+        self.features = list(features)
+        self.categories = [ORDER_MAP[f] for f in self.features]
+        self.radices = np.array([len(c) for c in self.categories], dtype=np.int8)
+        self.targets = dict(targets)
+        self.target_names = list(self.targets)
+        self.source = source
+        # Scores are code + 1, so each term is +/- code plus a constant
+        index = {f: j for j, f in enumerate(self.features)}
+        self.weights = np.zeros((len(self.features), len(self.targets)), dtype=np.int32)
+        self.offsets = np.zeros(len(self.targets), dtype=np.int32)
+        self.scales = np.zeros(len(self.targets), dtype=np.float64)
+        for k, terms in enumerate(self.targets.values()):
+            for term in terms:
+                inverted = term.startswith("-")
+                j = index[term.lstrip("-")]
+                self.weights[j, k] += -1 if inverted else 1
+                self.offsets[k] += len(self.categories[j]) if inverted else 1
+            self.scales[k] = 100.0 / (len(terms) * 5)
+
+    def score(self, codes):
+        """Target values for an ``(n_rows, n_features)`` code array."""
+        totals = codes.astype(np.int32) @ self.weights + self.offsets
+        return np.round(totals * self.scales, 1)
+
+
+THERAPY_CONFIGS = {
+    "general": TherapyConfig(
+        "general", GENERAL_FEATURES,
+        {"Overall_Improvement": GENERAL_FEATURES},
+        "General_Feedback_Synthetic.xlsx",
+    ),
+    "basti": TherapyConfig(
+        "basti",
+        GENERAL_FEATURES + ["Bowel_Dryness", "Gas_Formation", "Lower_Back_Pain", "Urinary_Frequency", "Constipation_Level"],
+        {
+            "Vata_Level": ["Bowel_Dryness", "Gas_Formation", "Lower_Back_Pain", "Urinary_Frequency", "Constipation_Level"],
+            "Overall_Improvement": IMPROVEMENT,
+        },
+        "Basti_Feedback_Synthetic.xlsx",
+    ),
+    "nasya": TherapyConfig(
+        "nasya",
+        GENERAL_FEATURES + ["Nasal_Dryness", "Headache", "Dizziness", "Sinus_Congestion", "Throat_Dryness"],
+        {
+            "Vata_Level": ["Nasal_Dryness", "Headache", "Dizziness", "Sinus_Congestion", "Throat_Dryness"],
+            "Overall_Improvement": IMPROVEMENT,
+        },
+        "Nasya_Feedback_Synthetic.xlsx",
+    ),
+    "vamana": TherapyConfig(
+        "vamana",
+        GENERAL_FEATURES + ["Body_Temperature", "Metabolism", "Immunity", "Thirst_Level", "Flexibility"],
+        {
+            "Kapha_Level": [
+                "-Energy_Level", "-Appetite", "-Digestion", "Stress_Level",
+                "-Physical_Activity", "-Metabolism", "-Concentration"
+            ],
+            "Overall_Improvement": ["Energy_Level", "Appetite", "Digestion", "Sleep_Quality", "Metabolism", "Immunity"],
+        },
+        "Vamana_Feedback_Synthetic (1).xlsx",
+    ),
+    "virechana": TherapyConfig(
+        "virechana",
+        GENERAL_FEATURES + ["Body_Heat", "Acidity", "Bowel_Movement", "Thirst_Level", "Skin_Inflammation"],
+        {
+            "Pitta_Level": ["Body_Heat", "Acidity", "Bowel_Movement", "Thirst_Level", "Skin_Inflammation"],
+            "Overall_Improvement": IMPROVEMENT,
+        },
+        "Virechana_Feedback_Synthetic.xlsx",
+    ),
+    "raktamokshana": TherapyConfig(
+        "raktamokshana",
+        GENERAL_FEATURES + ["Skin_Redness", "Body_Heat", "Acidity", "Bleeding_Tendency", "Inflammation"],
+        {
+            "Pitta_Level": ["Skin_Redness", "Body_Heat", "Acidity", "Bleeding_Tendency", "Inflammation"],
+            "Overall_Improvement": ["Energy_Level", "Appetite", "Digestion", "Sleep_Quality"],
+        },
+        "Raktamokshana_Feedback_Synthetic.xlsx",
+    ),
+}
+
+
+def generate_chunk(config, n_rows, seed):
+    """Draw ``n_rows`` uniform answers; returns ``(codes int8, targets float64)``."""
+    rng = np.random.default_rng(seed)
+    codes = rng.integers(0, config.radices, size=(n_rows, len(config.features)), dtype=np.int8)
+    return codes, config.score(codes)
+
+
+def iter_chunks(config, n_rows, chunk_size=1 << 20, seed=0):
+    """Yield ``(codes, targets)`` chunks covering ``n_rows`` rows; chunk ``i`` uses seed ``(seed, i)``."""
+    for i, start in enumerate(range(0, n_rows, chunk_size)):
+        yield generate_chunk(config, min(chunk_size, n_rows - start), (seed, i))
+
+
+def to_frame(config, codes, targets):
+    """DataFrame with category strings, laid out like the notebooks' ``.xlsx`` files."""
+    import pandas as pd
+
+    data = {
+        f: pd.Categorical.from_codes(codes[:, j], categories=config.categories[j], ordered=True)
+        for j, f in enumerate(config.features)
+    }
+    data.update({t: targets[:, k] for k, t in enumerate(config.target_names)})
+    return pd.DataFrame(data)
+
+
+def write_npy(config, directory, n_rows, chunk_size=1 << 20, seed=0):
+    """Stream codes and targets into ``<name>_codes.npy`` / ``<name>_targets.npy`` memmaps."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = [directory / f"{config.name}_codes.npy", directory / f"{config.name}_targets.npy"]
+    tmp_paths = [Path(f"{p}.tmp") for p in paths]
+    codes_out = np.lib.format.open_memmap(tmp_paths[0], mode="w+", dtype=np.int8, shape=(n_rows, len(config.features)))
+    targets_out = np.lib.format.open_memmap(tmp_paths[1], mode="w+", dtype=np.float64, shape=(n_rows, len(config.target_names)))
+    start = 0
+    for codes, targets in iter_chunks(config, n_rows, chunk_size, seed):
+        codes_out[start:start + len(codes)] = codes
+        targets_out[start:start + len(codes)] = targets
+        start += len(codes)
+    codes_out.flush()
+    targets_out.flush()
+    del codes_out, targets_out
+    for tmp_path, path in zip(tmp_paths, paths):
+        os.replace(tmp_path, path)
+    return paths
+
+
+def write_csv(config, path, n_rows, chunk_size=1 << 20, seed=0):
+    """Stream rows to CSV with category strings, one chunk at a time."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", newline="") as f:
+        for i, (codes, targets) in enumerate(iter_chunks(config, n_rows, chunk_size, seed)):
+            to_frame(config, codes, targets).to_csv(f, header=i == 0, index=False)
+    os.replace(tmp_path, path)
+    return [Path(path)]
+
+
+EXCEL_MAX_ROWS = 1_048_575
+
+
+def write_xlsx(config, path, n_rows, chunk_size=1 << 20, seed=0):
+    """Write a notebook-compatible ``.xlsx`` (small datasets only; Excel caps the row count)."""
+    if n_rows > EXCEL_MAX_ROWS:
+        raise ValueError(f"Excel holds at most {EXCEL_MAX_ROWS} rows; use csv or npy for {n_rows}")
+    import pandas as pd
+
+    frame = pd.concat([to_frame(config, c, t) for c, t in iter_chunks(config, n_rows, chunk_size, seed)])
+    frame.to_excel(path, index=False)
+    return [Path(path)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic feedback datasets")
+    parser.add_argument("therapies", nargs="*", help=f"any of {', '.join(THERAPY_CONFIGS)} (default: all)")
+    parser.add_argument("--rows", type=int, default=200)
+    parser.add_argument("--chunk-size", type=int, default=1 << 20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--format", choices=["npy", "csv", "xlsx"], default="npy")
+    parser.add_argument("--output", default="synthetic")
+    args = parser.parse_args()
+    unknown = [t for t in args.therapies if t not in THERAPY_CONFIGS]
+    if unknown:
+        parser.error(f"unknown therapies: {', '.join(unknown)}")
+
+    output = Path(args.output)
+    output.mkdir(parents=True, exist_ok=True)
+    for name in args.therapies or THERAPY_CONFIGS:
+        config = THERAPY_CONFIGS[name]
+        start = time.perf_counter()
+        if args.format == "npy":
+            paths = write_npy(config, output, args.rows, args.chunk_size, args.seed)
+        elif args.format == "csv":
+            paths = write_csv(config, output / f"{name}.csv", args.rows, args.chunk_size, args.seed)
+        else:
+            paths = write_xlsx(config, output / f"{name}.xlsx", args.rows, args.chunk_size, args.seed)
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {args.rows} rows in {elapsed:.2f}s ({args.rows / elapsed:,.0f} rows/s) -> {', '.join(p.name for p in paths)}")
@@ -0,0 +1,63 @@
+"""Models, feature lists and defaults shared by the web app and the offline tools."""
+
+model_files = {
+    "basti": "Basti",
+    "nasya": "Nasya",
+    "vamana": "Vamana",
+    "virechana": "Virechana",
+    "raktamokshana": "Raktamokshana",
+    "general": "General"
+}
+
+# Feature lists for each therapy
+therapy_features = {
+    "basti": [
+        "Concentration", "Sleep_Quality", "Digestion", "Flexibility",
+        "Energy_Level", "Appetite", "Stress_Level", "Physical_Activity",
+        "Hydration", "Mood_Swings", "Mood",
+        "Bowel_Dryness", "Gas_Formation", "Lower_Back_Pain",
+        "Urinary_Frequency", "Constipation_Level"
+    ],
+    "nasya": [
+        "Concentration", "Sleep_Quality", "Digestion", "Flexibility",
+        "Energy_Level", "Appetite", "Stress_Level", "Physical_Activity",
+        "Hydration", "Mood_Swings", "Mood",
+        "Nasal_Dryness", "Headache", "Dizziness", "Sinus_Congestion", "Throat_Dryness"
+    ],
+    "vamana": [
+        "Concentration", "Sleep_Quality", "Digestion", "Flexibility",
+        "Energy_Level", "Appetite", "Stress_Level", "Physical_Activity",
+        "Hydration", "Mood_Swings", "Mood",
+        "Body_Temperature", "Metabolism", "Immunity", "Thirst_Level"
+    ],
+    "virechana": [
+        "Concentration", "Sleep_Quality", "Digestion", "Flexibility",
+        "Energy_Level", "Appetite", "Stress_Level", "Physical_Activity",
+        "Hydration", "Mood_Swings", "Mood",
+        "Body_Heat", "Acidity", "Bowel_Movement", "Thirst_Level", "Skin_Inflammation"
+    ],
+    "raktamokshana": [
+        "Concentration", "Sleep_Quality", "Digestion", "Flexibility",
+        "Energy_Level", "Appetite", "Stress_Level", "Physical_Activity",
+        "Hydration", "Mood_Swings", "Mood",
+        "Skin_Redness", "Body_Heat", "Acidity", "Bleeding_Tendency", "Inflammation"
+    ]
+}
+
+general_features = [
+    "Concentration", "Sleep_Quality", "Digestion", "Flexibility",
+    "Energy_Level", "Appetite", "Stress_Level", "Physical_Activity",
+    "Hydration", "Mood_Swings", "Mood"
+]
+
+# Dosha each therapy's first model output measures
+therapy_dosha = {
+    "basti": "vata",
+    "nasya": "vata",
+    "vamana": "kapha",
+    "virechana": "pitta",
+    "raktamokshana": "pitta"
+}
+
+# Values used when a field is left out, matching the form defaults
+feature_defaults = {"Flexibility": "Average"}
@@ -0,0 +1,133 @@
+"""Declarative request schema for the therapy forms.
+
+``ORDER_MAP`` holds the ordinal category order of every answer, as in the
+``order_map`` cells of the training notebooks, so a category's position is
+the code the model's ``OrdinalEncoder`` produced for it. A ``TherapySchema``
+lists the fields one therapy accepts; ``bind`` turns it into a
+``FieldDecoder`` for a model's feature order, which decodes a form or JSON
+mapping straight into an int8 code vector with one dict lookup per field and
+reports every missing or unknown value at once as a ``SchemaValidationError``
+(FastAPI-style error dicts, ready for a field-level 422).
+"""
+import numpy as np
+
+FIVE_LEVELS = ["Very Low", "Low", "Moderate", "High", "Very High"]
+QUALITY = ["Very Poor", "Poor", "Average", "Good", "Excellent"]
+SEVERITY = ["None", "Mild", "Moderate", "Severe", "Very Severe"]
+
+ORDER_MAP = {
+    # General features
+    "Energy_Level": FIVE_LEVELS,
+    "Mood": ["Very Sad", "Sad", "Neutral", "Happy", "Very Happy"],
+    "Appetite": FIVE_LEVELS,
+    "Sleep_Quality": QUALITY,
+    "Digestion": QUALITY,
+    "Stress_Level": FIVE_LEVELS,
+    "Concentration": QUALITY,
+    "Physical_Activity": FIVE_LEVELS,
+    "Hydration": FIVE_LEVELS,
+    "Mood_Swings": FIVE_LEVELS,
+    "Flexibility": QUALITY,
+    # Basti
+    "Bowel_Dryness": SEVERITY,
+    "Gas_Formation": SEVERITY,
+    "Lower_Back_Pain": SEVERITY,
+    "Urinary_Frequency": FIVE_LEVELS,
+    "Constipation_Level": SEVERITY,
+    # Nasya
+    "Nasal_Dryness": SEVERITY,
+    "Headache": SEVERITY,
+    "Dizziness": SEVERITY,
+    "Sinus_Congestion": SEVERITY,
+    "Throat_Dryness": SEVERITY,
+    # Vamana
+    "Body_Temperature": ["Very Cold", "Cold", "Normal", "Warm", "Hot"],
+    "Metabolism": ["Very Slow", "Slow", "Moderate", "Fast", "Very Fast"],
+    "Immunity": ["Very Weak", "Weak", "Average", "Strong", "Very Strong"],
+    "Thirst_Level": FIVE_LEVELS,
+    # Virechana
+    "Body_Heat": FIVE_LEVELS,
+    "Acidity": FIVE_LEVELS,
+    "Bowel_Movement": ["Very Rare", "Rare", "Normal", "Frequent", "Very Frequent"],
+    "Skin_Inflammation": SEVERITY,
+    # Raktamokshana
+    "Skin_Redness": SEVERITY,
+    "Bleeding_Tendency": SEVERITY,
+    "Inflammation": SEVERITY,
+}
+
+
+class SchemaValidationError(ValueError):
+    """Missing or unknown field values; ``errors`` is a list of FastAPI-style error dicts."""
+
+    def __init__(self, errors):
+        super().__init__("; ".join(f"{e['loc'][-1]}: {e['msg']}" for e in errors))
+        self.errors = errors
+
+
+class FieldDecoder:
+    """Decodes a mapping of answers into int8 codes in one model's feature order."""
+
+    def __init__(self, feature_names, categories, code_maps, defaults):
+        self.feature_names = list(feature_names)
+        self.n_features = len(self.feature_names)
+        self.labels = [categories[f] for f in self.feature_names]
+        # Error messages are built once so rejecting a request stays cheap
+        self.plan = [
+            (f, code_maps[f], code_maps[f].get(defaults.get(f)),
+             "Input should be " + ", ".join(repr(c) for c in categories[f]))
+            for f in self.feature_names
+        ]
+
+    def decode(self, values, out=None):
+        """Fill ``out`` (or a new int8 vector) with the codes of ``values``, a dict-like of strings."""
+        if out is None:
+            out = np.empty(self.n_features, dtype=np.int8)
+        errors = None
+        for i, (name, code_map, default, expected) in enumerate(self.plan):
+            value = values.get(name)
+            if value is None:
+                code = default
+                if code is None:
+                    errors = errors or []
+                    errors.append({"type": "missing", "loc": ["body", name], "msg": "Field required", "input": None})
+                    continue
+            else:
+                code = code_map.get(value) if isinstance(value, str) else None
+                if code is None:
+                    errors = errors or []
+                    errors.append({"type": "enum", "loc": ["body", name], "msg": expected, "input": value})
+                    continue
+            out[i] = code
+        if errors:
+            raise SchemaValidationError(errors)
+        return out
+
+    def values(self, codes):
+        """Category strings for a code vector, in feature order."""
+        return [labels[code] for labels, code in zip(self.labels, codes)]
+
+
+class TherapySchema:
+    def __init__(self, name, fields, defaults=None, order_map=ORDER_MAP):
+        self.name = name
+        self.fields = list(fields)
+        self.categories = {f: list(order_map[f]) for f in self.fields}
+        self.code_maps = {f: {c: i for i, c in enumerate(cats)} for f, cats in self.categories.items()}
+        self.defaults = {f: v for f, v in (defaults or {}).items() if f in self.categories}
+        self._decoders = {}
+
+    def bind(self, feature_names, categories=None):
+        """Decoder for a model's feature order; ``categories`` (the model's) must match the schema's."""
+        key = tuple(feature_names)
+        decoder = self._decoders.get(key)
+        if decoder is None:
+            unknown = [f for f in feature_names if f not in self.categories]
+            if unknown:
+                raise ValueError(f"{self.name} model uses features outside its schema: {', '.join(unknown)}")
+            if categories is not None:
+                for f in feature_names:
+                    if list(categories[f]) != self.categories[f]:
+                        raise ValueError(f"{self.name} model orders {f!r} as {list(categories[f])}, schema as {self.categories[f]}")
+            decoder = self._decoders[key] = FieldDecoder(feature_names, self.categories, self.code_maps, self.defaults)
+        return decoder
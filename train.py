@@ -0,0 +1,246 @@
+"""Retrain the serving pipelines from the command line.
+
+Rebuilds the notebooks' ``Pipeline(ColumnTransformer(OrdinalEncoder) ->
+MultiOutputRegressor(XGBRegressor))`` for every therapy, or the ones named::
+
+    python train.py                          # all six models
+    python train.py basti vamana --early-stopping 30
+    python train.py --synthetic-rows 1000000 --jobs 8
+
+Every (therapy, target) booster is an independent task on a process pool,
+each process capped at ``--threads`` native threads, so retraining scales
+with the available cores instead of fitting one output after another. Trees
+use XGBoost's ``hist`` method. With ``--early-stopping N`` a validation
+split is held out of the training rows and each booster keeps its best
+iteration. ``--multi-output`` fits one booster per therapy on both targets
+instead (``Pipeline(ColumnTransformer -> XGBRegressor)``), so ``predict``
+builds a single DMatrix; the compiled artifacts already evaluate every
+output's trees in one pass either way.
+
+Each model is written atomically as ``<Name>_model.pkl`` (same structure as
+the notebooks' pickles), its compiled ``<Name>_model.npz`` and a
+``<Name>_model.json`` manifest recording the feature order, category maps,
+hyperparameters, test metrics and training time. A retrained General model
+leaves ``General_table.npy`` stale; rebuild it with ``general_table.py``.
+"""
+import argparse
+import json
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from compiled_model import compile_pipeline, file_sha256, save_artifact
+from dataset import load_dataset
+from native_threads import limit_native_threads
+from synthetic_data import THERAPY_CONFIGS, iter_chunks, to_frame
+from therapies import model_files
+
+base_dir = Path(__file__).resolve().parent
+
+# Hyperparameters from the training notebooks, plus the hist tree method
+XGB_PARAMS = {
+    "objective": "reg:squarederror",
+    "n_estimators": 300,
+    "max_depth": 4,
+    "learning_rate": 0.05,
+    "subsample": 0.8,
+    "colsample_bytree": 0.8,
+    "reg_alpha": 0.1,
+    "reg_lambda": 1,
+    "random_state": 42,
+    "tree_method": "hist",
+}
+
+def fit_booster(X_train, y_train, X_val, y_val, params, early_stopping, threads):
+    """Fit one XGBRegressor (one target, or all columns of a 2-D ``y_train``); runs in a pool process."""
+    from xgboost import XGBRegressor
+    from xgboost.callback import EarlyStopping
+
+    callbacks = None
+    if early_stopping:
+        # save_best trims the booster to its best iteration, so the compiled arrays match predict
+        callbacks = [EarlyStopping(rounds=early_stopping, save_best=True)]
+    model = XGBRegressor(**params, n_jobs=threads, callbacks=callbacks)
+    start = time.perf_counter()
+    if early_stopping:
+        model.fit(X_train, y_train, eval_set=[(X_val, y_val)], verbose=False)
+    else:
+        model.fit(X_train, y_train)
+    return model, time.perf_counter() - start
+
+
+def load_codes(config, synthetic_rows=None, seed=42):
+    """The therapy's ``(codes, targets)``: its cached source dataset, or freshly generated synthetic rows."""
+    if synthetic_rows:
+        chunks = list(iter_chunks(config, synthetic_rows, seed=seed))
+        codes = np.concatenate([c for c, _ in chunks])
+        targets = np.concatenate([t for _, t in chunks])
+        return codes, targets, f"synthetic:{synthetic_rows}:{seed}"
+    dataset = load_dataset(config.name)
+    return dataset.codes, dataset.targets, f"{dataset.source.name}:{file_sha256(dataset.source)}"
+
+
+class TherapyJob:
+    """Data split, encoder and booster futures for one therapy's pipeline."""
+
+    def __init__(self, name, args):
+        from sklearn.compose import ColumnTransformer
+        from sklearn.model_selection import train_test_split
+        from sklearn.preprocessing import OrdinalEncoder
+
+        self.name = name
+        self.config = THERAPY_CONFIGS[name]
+        self.early_stopping_rounds = args.early_stopping
+        self.multi_output = args.multi_output
+        self.started = time.perf_counter()
+        codes, targets, self.data_source = load_codes(self.config, args.synthetic_rows, args.seed)
+        # The cached codes are exactly what the OrdinalEncoder would produce, so the
+        # boosters train on them directly; only the test rows go through strings again
+        X_train, X_test, self.y_train, self.y_test = train_test_split(
+            np.asarray(codes, dtype=np.float64), np.asarray(targets), test_size=args.test_size, random_state=args.seed
+        )
+        self.X_test = to_frame(self.config, X_test.astype(np.int8), self.y_test)[self.config.features]
+        self.X_fit, self.y_fit = X_train, self.y_train
+        self.X_val = self.y_val = None
+        if args.early_stopping:
+            self.X_fit, self.X_val, self.y_fit, self.y_val = train_test_split(
+                X_train, self.y_train, test_size=args.validation_size, random_state=args.seed
+            )
+        self.preprocessor = ColumnTransformer([
+            ("OrdinalEncoder", OrdinalEncoder(categories=[list(c) for c in self.config.categories]), self.config.features)
+        ])
+        # With fixed categories, fitting only records the input columns
+        self.preprocessor.fit(self.X_test)
+        self.futures = []
+
+    def submit(self, pool, args):
+        if self.multi_output:
+            self.futures.append(pool.submit(
+                fit_booster, self.X_fit, self.y_fit, self.X_val, self.y_val,
+                XGB_PARAMS, args.early_stopping, args.threads
+            ))
+            return
+        for k in range(len(self.config.target_names)):
+            y_val = self.y_val[:, k] if self.y_val is not None else None
+            self.futures.append(pool.submit(
+                fit_booster, self.X_fit, self.y_fit[:, k], self.X_val, y_val,
+                XGB_PARAMS, args.early_stopping, args.threads
+            ))
+
+    def finish(self, output_dir):
+        """Assemble the pipeline from the fitted boosters, score it and write its artifacts."""
+        from sklearn.metrics import mean_squared_error, r2_score
+        from sklearn.multioutput import MultiOutputRegressor
+        from sklearn.pipeline import Pipeline
+        from xgboost import XGBRegressor
+
+        fitted = [future.result() for future in self.futures]
+        if self.multi_output:
+            regressor = fitted[0][0]
+            # One booster serves every target
+            fitted = fitted * len(self.config.target_names)
+        else:
+            regressor = MultiOutputRegressor(XGBRegressor(**XGB_PARAMS))
+            regressor.estimators_ = [model for model, _ in fitted]
+            regressor.n_features_in_ = self.X_fit.shape[1]
+        pipeline = Pipeline([("preprocessor", self.preprocessor), ("XGB_model", regressor)])
+
+        y_pred = pipeline.predict(self.X_test)
+        metrics = {}
+        for k, target in enumerate(self.config.target_names):
+            booster = fitted[k][0].get_booster()
+            metrics[target] = {
+                "r2": float(r2_score(self.y_test[:, k], y_pred[:, k])),
+                "rmse": float(np.sqrt(mean_squared_error(self.y_test[:, k], y_pred[:, k]))),
+                "n_trees": booster.num_boosted_rounds(),
+                "fit_seconds": fitted[k][1],
+            }
+
+        stem = model_files[self.name]
+        pkl_path = Path(output_dir) / f"{stem}_model.pkl"
+        write_atomic(pkl_path, pickle.dumps(pipeline))
+        source_sha256 = file_sha256(pkl_path)
+        save_artifact(compile_pipeline(pipeline), pkl_path.with_suffix(".npz"), source_sha256=source_sha256)
+
+        import sklearn
+        import xgboost
+
+        manifest = {
+            "therapy": self.name,
+            "model_file": pkl_path.name,
+            "model_sha256": source_sha256,
+            "feature_names": self.config.features,
+            "categories": {f: list(c) for f, c in zip(self.config.features, self.config.categories)},
+            "targets": self.config.target_names,
+            "params": XGB_PARAMS,
+            "early_stopping_rounds": self.early_stopping_rounds,
+            "multi_output": self.multi_output,
+            "metrics": metrics,
+            "data_source": self.data_source,
+            "train_rows": len(self.X_fit),
+            "validation_rows": 0 if self.X_val is None else len(self.X_val),
+            "test_rows": len(self.X_test),
+            "training_seconds": time.perf_counter() - self.started,
+            "trained_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "versions": {"xgboost": xgboost.__version__, "scikit-learn": sklearn.__version__, "numpy": np.__version__},
+        }
+        write_atomic(pkl_path.with_suffix(".json"), json.dumps(manifest, indent=2).encode("utf-8"))
+        return manifest
+
+
+def write_atomic(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def train(names, args):
+    """Train ``names`` concurrently and write their artifacts; returns the manifests."""
+    jobs = [TherapyJob(name, args) for name in names]
+    n_tasks = sum(1 if job.multi_output else len(job.config.target_names) for job in jobs)
+    workers = args.jobs or max(1, min(n_tasks, (os.cpu_count() or 1) // args.threads))
+    print(f"Fitting {n_tasks} boosters for {len(jobs)} models on {workers} processes x {args.threads} threads")
+    with ProcessPoolExecutor(max_workers=workers, initializer=limit_native_threads, initargs=(args.threads,)) as pool:
+        for job in jobs:
+            job.submit(pool, args)
+        manifests = []
+        for job in jobs:
+            manifest = job.finish(args.output)
+            scores = ", ".join(f"{t} r2={m['r2']:.4f} rmse={m['rmse']:.3f}" for t, m in manifest["metrics"].items())
+            print(f"{job.name}: {scores} ({manifest['training_seconds']:.1f}s)")
+            manifests.append(manifest)
+    return manifests
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Retrain the therapy and General pipelines")
+    parser.add_argument("therapies", nargs="*", help=f"any of {', '.join(model_files)} (default: all)")
+    parser.add_argument("--output", default=str(base_dir), help="directory for the model artifacts")
+    parser.add_argument("--jobs", type=int, default=None, help="pool processes (default: cores / threads)")
+    parser.add_argument("--threads", type=int, default=1, help="native threads per process")
+    parser.add_argument("--early-stopping", type=int, default=0, metavar="ROUNDS",
+                        help="stop a booster after ROUNDS rounds without validation improvement")
+    parser.add_argument("--multi-output", action="store_true",
+                        help="fit one booster on all of a therapy's targets instead of one per target")
+    parser.add_argument("--validation-size", type=float, default=0.1)
+    parser.add_argument("--test-size", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--synthetic-rows", type=int, default=None,
+                        help="train on this many freshly generated rows instead of the .xlsx files")
+    args = parser.parse_args(argv)
+    unknown = [t for t in args.therapies if t not in model_files]
+    if unknown:
+        parser.error(f"unknown therapies: {', '.join(unknown)}")
+    Path(args.output).mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    train(args.therapies or list(model_files), args)
+    print(f"Done in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""What-if sensitivity sweeps over one patient's encoded answers.
+
+``single_variants`` changes one answer at a time to each of its other levels
+(64 rows for 16 five-level features); ``pair_variants`` moves two answers by
+one level each. ``sweep`` stacks the patient's own row and every variant into
+one code matrix, scores it with a single ``predict_codes`` call per model and
+returns each variant's outputs and deltas from the patient's baseline.
+"""
+from itertools import combinations
+
+import numpy as np
+
+
+def single_variants(codes, radices):
+    """Every row differing from ``codes`` in exactly one feature; returns ``(matrix, changes)``."""
+    changes = [((j, int(codes[j]), level),) for j, radix in enumerate(radices) for level in range(radix) if level != codes[j]]
+    return _apply(codes, changes), changes
+
+
+def pair_variants(codes, radices, max_variants, priority=None):
+    """Rows moving two features by one level each, at most ``max_variants`` of them.
+
+    When the cap bites, pairs of the features listed first in ``priority``
+    (e.g. ranked by single-feature effect) are kept.
+    """
+    order = [int(j) for j in priority] if priority is not None else list(range(len(radices)))
+    steps = {j: [int(codes[j]) + d for d in (-1, 1) if 0 <= codes[j] + d < radices[j]] for j in order}
+    changes = []
+    # Pairs among the first k features, growing k, so the cap keeps the most relevant ones
+    for k in range(1, len(order)):
+        for i in order[:k]:
+            j = order[k]
+            for a in steps[i]:
+                for b in steps[j]:
+                    changes.append(((i, int(codes[i]), a), (j, int(codes[j]), b)))
+        if len(changes) >= max_variants:
+            break
+    changes = changes[:max_variants]
+    return _apply(codes, changes), changes
+
+
+def _apply(codes, changes):
+    matrix = np.repeat(np.asarray(codes, dtype=np.int8)[None, :], len(changes), axis=0)
+    for row, change in enumerate(changes):
+        for j, _, level in change:
+            matrix[row, j] = level
+    return matrix
+
+
+def sweep(model, general, general_columns, codes, pairs=False, max_variants=1024, rank_output=0):
+    """Score the baseline and its variants in one batch per model.
+
+    Returns ``(baseline, outputs, changes, truncated)``: the patient's outputs
+    (therapy outputs then the General one), a ``(n_variants, n_outputs)``
+    matrix, the ``(feature, from, to)`` changes of each variant and how many
+    single and pair variants the cap left out. With ``pairs`` at least half of
+    ``max_variants`` is kept for pairs (when there are that many), so a cap
+    below the number of singles still returns some. A pairwise sweep over its
+    share needs a second batch: the single-feature scores pick which pairs to
+    keep.
+    """
+    codes = np.asarray(codes, dtype=np.int8)
+    radices = [len(model.categories[f]) for f in model.feature_names]
+    matrix, changes = single_variants(codes, radices)
+    n_singles, n_pairs = len(changes), 0
+    if pairs:
+        n_steps = [int(codes[j] > 0) + int(codes[j] < radix - 1) for j, radix in enumerate(radices)]
+        n_pairs = sum(a * b for a, b in combinations(n_steps, 2))
+    pair_budget = min(n_pairs, max(max_variants // 2, max_variants - n_singles))
+    single_budget = max_variants - pair_budget
+    matrix, changes = matrix[:single_budget], changes[:single_budget]
+    n_kept_singles = len(changes)
+    if pair_budget and n_pairs <= pair_budget:
+        pair_matrix, pair_changes = pair_variants(codes, radices, pair_budget)
+        matrix, changes = np.vstack([matrix, pair_matrix]), changes + pair_changes
+    scored = _score(model, general, general_columns, np.vstack([codes[None, :], matrix]))
+    if pair_budget and n_pairs > pair_budget:
+        # Pairs of the features whose single-level changes moved the ranked output most
+        effect = np.zeros(len(radices))
+        np.maximum.at(effect, [c[0][0] for c in changes], np.abs(scored[1:, rank_output] - scored[0, rank_output]))
+        pair_matrix, pair_changes = pair_variants(codes, radices, pair_budget, priority=np.argsort(-effect, kind="stable"))
+        scored = np.vstack([scored, _score(model, general, general_columns, pair_matrix)])
+        changes = changes + pair_changes
+    truncated = {"singles": n_singles - n_kept_singles, "pairs": n_pairs - (len(changes) - n_kept_singles)}
+    return scored[0], scored[1:], changes, truncated
+
+
+def _score(model, general, general_columns, X):
+    therapy_pred = model.predict_codes(X)
+    general_pred = general.predict_codes(X[:, general_columns])
+    return np.hstack([therapy_pred, general_pred[:, :1]]).astype(np.float64)